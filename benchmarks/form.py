@@ -0,0 +1,41 @@
+#Vectorized EWMA form of all players against the prefix form of every row, computed per player as before
+#usage: python benchmarks/form.py --players 650 3250
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fantasydata.process_data as pr
+from synthetic import make_season
+
+def prefix_form(histories:list[np.ndarray]) -> np.ndarray:
+    #The previous implementation, calc_norm_form of the prefix for every row of every player
+    return np.concatenate([[pr.calc_norm_form(scores[:i+1]) for i in range(len(scores))] for scores in histories])
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Vectorized player form")
+    parser.add_argument("--players", type=int, nargs="+", default=[650,3250])
+    args = parser.parse_args()
+
+    for n_players in args.players:
+
+        players,_,_,_,_ = make_season(n_players=n_players,n_teams=20,n_finished_rounds=38)
+        histories = [p.history["total_points"].values.astype(np.float64) for p in players if p.history is not None]
+        scores = np.concatenate(histories)
+        positions = np.concatenate([np.arange(len(h)) for h in histories])
+
+        t0 = time.perf_counter()
+        expected = prefix_form(histories)
+        loop = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        form = pr.ewma_form(scores,positions)
+        vectorized = time.perf_counter() - t0
+
+        error = np.max(np.abs(form-expected))
+        print(f"{n_players} players, {len(scores)} rows: prefix loop {loop:.3f} s, vectorized {1e3*vectorized:.2f} ms, speedup {loop/vectorized:.0f}x, max difference {error:.1e}")
@@ -0,0 +1,53 @@
+#Bulk serialization of entities with utility.list_to_dataframe on synthetic seasons
+#usage: python benchmarks/list_to_dataframe.py --players 650 1300 3250 6500
+from copy import deepcopy
+import argparse
+import os
+import sys
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fantasydata.utility as ut
+from synthetic import make_season
+
+def concat_loop(object_list:list) -> pd.DataFrame:
+    #The previous implementation, one concatenation per entity
+    df = pd.DataFrame()
+    for o in object_list:
+        df = pd.concat([df,o.to_dataframe()])
+    df.reset_index(drop=True, inplace=True)
+    return df
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Bulk serialization of entities")
+    parser.add_argument("--players", type=int, nargs="+", default=[650,1300,3250,6500])
+    parser.add_argument("--loop-max-players", type=int, default=1300, help="Largest player count timed with the previous concatenation loop")
+    args = parser.parse_args()
+
+    #One season of 20 teams and 38 rounds, more players stand for several seasons
+    base_players,_,_,_,_ = make_season(n_players=650,n_teams=20,n_finished_rounds=38)
+    for p in base_players:
+        p.predicted_points = [2.0]*5
+
+    for n_players in args.players:
+
+        players = [deepcopy(base_players[k % len(base_players)]) for k in range(n_players)]
+        n_rows = sum(1 if p.history is None else len(p.history) for p in players)
+
+        t0 = time.perf_counter()
+        df = ut.list_to_dataframe(players)
+        elapsed = time.perf_counter() - t0
+        s = f"{n_players} players, {n_rows} rows: {elapsed:.3f} s, {1e6*elapsed/n_rows:.2f} us per row"
+
+        if n_players <= args.loop_max_players:
+            t0 = time.perf_counter()
+            expected = concat_loop(players)
+            loop_elapsed = time.perf_counter() - t0
+            same = expected.drop(columns=["predicted_points"]).equals(df[expected.keys()].drop(columns=["predicted_points"]))
+            s += f", concatenation loop {loop_elapsed:.3f} s ({1e6*loop_elapsed/n_rows:.2f} us per row), same rows {same}"
+
+        print(s)
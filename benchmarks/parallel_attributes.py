@@ -0,0 +1,50 @@
+#Serial and parallel player attributes (team, round and form) on synthetic seasons
+#usage: python benchmarks/parallel_attributes.py --players 650 3250 --workers 2 4
+from copy import deepcopy
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fantasydata.process_data as pr
+from synthetic import make_season
+
+def player_columns(players:list) -> list[np.ndarray]:
+    return [p.history[c].values for p in players if p.history is not None for c in ["team_id","round","form"]]
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Serial and parallel player attributes")
+    parser.add_argument("--players", type=int, nargs="+", default=[650,3250])
+    parser.add_argument("--workers", type=int, nargs="+", default=[2,4])
+    parser.add_argument("--chunk-size", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cpus")
+    for n_players in args.players:
+
+        #A full season of 20 teams, more players stand for several seasons of history
+        players,teams,matches,squad,initial_elo = make_season(n_players=n_players,n_teams=20,n_finished_rounds=38)
+        n_rows = sum(len(p.history) for p in players if p.history is not None)
+
+        #The first run imports and warms up the code paths, it is not timed
+        pr.add_player_attributes_parallel(deepcopy(players),matches,n_workers=1)
+
+        serial_players = deepcopy(players)
+        t0 = time.perf_counter()
+        pr.add_player_attributes_parallel(serial_players,matches,n_workers=1)
+        serial = time.perf_counter() - t0
+        print(f"{n_players} players, {n_rows} rows: serial {serial:.3f} s")
+
+        expected = player_columns(serial_players)
+        for n_workers in args.workers:
+            parallel_players = deepcopy(players)
+            t0 = time.perf_counter()
+            pr.add_player_attributes_parallel(parallel_players,matches,n_workers=n_workers,chunk_size=args.chunk_size)
+            elapsed = time.perf_counter() - t0
+            same = all(np.array_equal(a,b,equal_nan=True) for a,b in zip(expected,player_columns(parallel_players)))
+            print(f"  {n_workers} workers: {elapsed:.3f} s, speedup {serial/elapsed:.2f}, same result {same}")
@@ -0,0 +1,56 @@
+#Time per PlayerPointPredictor.predict call with the cached current values of the entities, and with the
+#values read from the history frames on every call as before the cache
+#usage: python benchmarks/prediction_overhead.py --repeat 20
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fantasydata.process_data as pr
+from fantasydata.classes import PlayerPointPredictor
+from synthetic import make_season
+
+def predict_all(model:PlayerPointPredictor, pairs:list[tuple], uncached:bool) -> list[float]:
+    predictions = []
+    for p,team,opponent in pairs:
+        if uncached:
+            p.invalidate_cache()
+            team.invalidate_cache()
+            opponent.invalidate_cache()
+        predictions.append(model.predict(p,team,opponent))
+    return predictions
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Per prediction overhead of the entity classes")
+    parser.add_argument("--players", type=int, default=650)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    players,teams,matches,squad,initial_elo = make_season(n_players=args.players,n_teams=20,n_finished_rounds=30)
+    pr.add_calculated_attributes(players,teams,matches,squad,initial_elo)
+    model = PlayerPointPredictor(1.0,0.5,-0.2,0.01)
+
+    #Every player against the opponents of their team in the remaining rounds
+    teams_by_id = {t.id:t for t in teams}
+    pairs = []
+    for m in matches:
+        if m.finished:
+            continue
+        for team_id,opponent_id in [(m.home_team_id,m.away_team_id),(m.away_team_id,m.home_team_id)]:
+            team = teams_by_id[team_id]
+            pairs += [(p,team,teams_by_id[opponent_id]) for p in players if p.current_team_id == team_id]
+
+    results = {}
+    for name,uncached in [("history lookups",True),("cached values",False)]:
+        predict_all(model,pairs,uncached)
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            results[name] = predict_all(model,pairs,uncached)
+        elapsed = time.perf_counter() - t0
+        print(f"{name}: {1e6*elapsed/(args.repeat*len(pairs)):.3f} us per prediction ({len(pairs)} predictions)")
+
+    print(f"same predictions {results['history lookups'] == results['cached values']}")
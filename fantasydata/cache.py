@@ -0,0 +1,224 @@
+from typing import Any, Callable
+from urllib.parse import urlparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+#Time to live in seconds for each class of endpoint, the first matching pattern is used
+DEFAULT_TTL = [
+    ("live", r"/event/\d+/live/", 60.0),
+    ("picks", r"/entry/\d+/event/\d+/picks/", 3600.0),
+    ("fixtures", r"/fixtures/", 24*3600.0),
+    ("bootstrap", r"/bootstrap-static/", 3600.0),
+    ("element_summary", r"/element-summary/\d+/", 3600.0),
+    ("other", r".*", 600.0),
+]
+
+class ResponseCache:
+
+    directory:str
+    max_bytes:int
+    hits:int
+    misses:int
+    revalidated:int
+    evicted:int
+
+    def __init__(self, directory:str, max_bytes:int = 200*1024**2, ttl:dict[str,float] = None) -> None:
+        if max_bytes < 1:
+            raise ValueError(f"Cache size must be positive: {max_bytes}")
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evicted = 0
+
+        if ttl is None:
+            ttl = {}
+        self._ttl = [(name, re.compile(pattern), ttl.get(name,default)) for name,pattern,default in DEFAULT_TTL]
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+        #Last access time and size on disk of every stored response, used for LRU eviction
+        self._entries = {}
+        for f in os.listdir(directory):
+            if f.endswith(".json"):
+                key = f[:-len(".json")]
+                self._entries[key] = [os.path.getmtime(self._body_path(key)), self._entry_size(key)]
+        self._evict()
+
+    def _key(self, url:str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _body_path(self, key:str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _meta_path(self, key:str) -> str:
+        return os.path.join(self.directory, f"{key}.meta")
+
+    def ttl(self, url:str) -> float:
+        path = urlparse(url).path
+        for _,pattern,ttl in self._ttl:
+            if pattern.search(path):
+                return ttl
+        return 0.0
+
+    def _read_meta(self, key:str) -> dict[str,Any]:
+        try:
+            with open(self._meta_path(key),"r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _entry_size(self, key:str) -> int:
+        size = 0
+        for path in [self._body_path(key),self._meta_path(key)]:
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return size
+
+    def _read_body(self, key:str) -> bytes:
+        path = self._body_path(key)
+        with open(path,"rb") as f:
+            content = f.read()
+        #The file modification time is kept as the last access time so that LRU order survives restarts
+        os.utime(path)
+        if key in self._entries:
+            self._entries[key][0] = time.time()
+        return content
+
+    def _fresh_content(self, url:str) -> bytes:
+        key = self._key(url)
+        with self._lock:
+            meta = self._read_meta(key)
+            if meta is None or meta["url"] != url or time.time() - meta["stored_at"] > self.ttl(url):
+                return None
+            try:
+                return self._read_body(key)
+            except OSError:
+                return None
+
+    def _count(self, hit:bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get_content(self, url:str) -> bytes:
+
+        #Every request that is not served from the cache without asking the server is a miss,
+        #also when the stale entry is revalidated or the request fails afterwards
+        content = self._fresh_content(url)
+        self._count(content is not None)
+        return content
+
+    def get(self, url:str, decode:Callable[[bytes],Any] = None) -> Any:
+
+        #Only the file is read under the lock, threads decoding different responses do not wait for each other
+        content = self._fresh_content(url)
+        if content is None:
+            self._count(False)
+            return None
+        try:
+            res = decode(content) if decode is not None else json.loads(content)
+        except ValueError:
+            self._count(False)
+            return None
+        self._count(True)
+        return res
+
+    def conditional_headers(self, url:str) -> dict[str,str]:
+
+        key = self._key(url)
+        headers = {}
+        with self._lock:
+            meta = self._read_meta(key)
+            if meta is None or meta["url"] != url or not os.path.exists(self._body_path(key)):
+                return headers
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def revalidate_content(self, url:str) -> bytes:
+
+        #The server answered 304 Not Modified, so the stored body is fresh again. Returns None if the
+        #entry was evicted after the conditional request was sent, the caller must then get the url again
+        key = self._key(url)
+        with self._lock:
+            meta = self._read_meta(key)
+            if meta is None or meta["url"] != url:
+                return None
+            try:
+                content = self._read_body(key)
+            except OSError:
+                return None
+            meta["stored_at"] = time.time()
+            with open(self._meta_path(key),"w") as f:
+                json.dump(meta,f)
+            self.revalidated += 1
+            return content
+
+    def revalidate(self, url:str, decode:Callable[[bytes],Any] = None) -> Any:
+
+        content = self.revalidate_content(url)
+        if content is None:
+            return None
+        try:
+            return decode(content) if decode is not None else json.loads(content)
+        except ValueError:
+            return None
+
+    def put(self, url:str, content:bytes, etag:str = None, last_modified:str = None) -> None:
+
+        key = self._key(url)
+        meta = {"url": url, "etag": etag, "last_modified": last_modified, "stored_at": time.time()}
+
+        with self._lock:
+            with open(self._body_path(key),"wb") as f:
+                f.write(content)
+            with open(self._meta_path(key),"w") as f:
+                json.dump(meta,f)
+            self._entries[key] = [time.time(), self._entry_size(key)]
+            self._evict()
+
+    def size(self) -> int:
+        return sum(size for _,size in self._entries.values())
+
+    def _evict(self) -> None:
+
+        total = self.size()
+        if total <= self.max_bytes:
+            return
+
+        #Remove the least recently used responses until the cache fits
+        for key,(_,size) in sorted(self._entries.items(), key=lambda e: e[1][0]):
+            if total <= self.max_bytes:
+                break
+            for path in [self._body_path(key),self._meta_path(key)]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            del self._entries[key]
+            total -= size
+            self.evicted += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            for f in os.listdir(self.directory):
+                if f.endswith(".json") or f.endswith(".meta"):
+                    os.remove(os.path.join(self.directory,f))
+            self._entries = {}
+
+    def __str__(self) -> str:
+        return f"{self.hits} hits, {self.revalidated} revalidated, {self.misses} misses, {self.evicted} evicted\n"
@@ -1,6 +1,29 @@
 from dataclasses import dataclass
+from typing import Any, TYPE_CHECKING
 import pandas as pd
+import numpy as np
+
+if TYPE_CHECKING:
+    from fantasydata.store import HistoryStore
+
+def history_to_dataframe(history:pd.DataFrame, attributes:dict[str,Any]) -> pd.DataFrame:
+
+    if history is None:
+        return pd.DataFrame({k:[v] for k,v in attributes.items()})
+
+    df = pd.DataFrame(history)
+    for k,v in attributes.items():
+        if isinstance(v,list):
+            #List attributes are the same for every row, so they are only stored in the last row
+            df[k] = [None]*(len(df)-1) + [v] if len(df) > 0 else []
+        else:
+            df[k] = v
+
+    return df
+
 class Player:
+
+    __slots__ = ("_id","_name","_position","_current_value","chance_of_playing","current_team_id","current_team_name","squad_adjusted_value","_history","_store","_store_version","predicted_points","_current_form")
     
     _id:int
     _name:str
@@ -29,7 +52,10 @@ class Player:
         self.current_team_id = team_id
         self.current_team_name = team_name
         self.chance_of_playing = 1.0
-        self.history = None
+        self._history = None
+        self._store = None
+        self._store_version = -1
+        self._current_form = None
         self.predicted_points = []
 
     @property
@@ -48,43 +74,62 @@ class Player:
     def current_value(self) -> int:
         return self._current_value
 
+    @property
+    def history(self) -> pd.DataFrame:
+        #A history kept in a HistoryStore is sliced from the store when it is used after the store changed
+        if self._store is not None and self._store_version != self._store.version:
+            self._history = self._store.view(self._id)
+            self._store_version = self._store.version
+            self.invalidate_cache()
+        return self._history
+
+    @history.setter
+    def history(self, history:pd.DataFrame) -> None:
+        self._history = history
+        self._store = None
+        self.invalidate_cache()
+
+    def attach_history_store(self, store:"HistoryStore") -> None:
+        self._history = None
+        self._store = store
+        self._store_version = -1
+        self.invalidate_cache()
+
+    def invalidate_cache(self) -> None:
+        #Must be called if the history is modified in place
+        self._current_form = None
+
     @property
     def current_form(self) -> float:
-        if self.history is None or len(self.history["form"]) < 1:
-            return 1.0
-        return self.history["form"].values[-1]               
+        history = self.history
+        if self._current_form is None:
+            if history is None or len(history["form"]) < 1:
+                self._current_form = 1.0
+            else:
+                self._current_form = history["form"].values[-1]               
+        return self._current_form
+
+    def attributes(self) -> dict[str,Any]:
+        return {
+            "player_id": self.id,
+            "name": self.name,
+            "position": self.position,
+            "current_team_id": self.current_team_id,
+            "current_team_name": self.current_team_name,
+            "predicted_points": self.predicted_points,
+            "current_value": self.current_value,
+            "squad_adjusted_value": self.squad_adjusted_value,
+            "chance_of_playing": self.chance_of_playing,
+        }
 
     def to_dataframe(self) -> pd.DataFrame:
-
-        if self.history is None:
-            df = pd.DataFrame()
-            df["player_id"] = [self.id]
-            df["name"] = [self.name]
-            df["position"] = [self.position]
-            df["current_team_id"] = [self.current_team_id]
-            df["current_team_name"] = [self.current_team_name]
-            df["predicted_points"] = [self.predicted_points]
-            df["current_value"] = [self.current_value]
-            df["squad_adjusted_value"] = [self.squad_adjusted_value]
-            df["chance_of_playing"] = [self.chance_of_playing]
-
-        else:
-            df = pd.DataFrame(self.history)
-            df["player_id"] = self.id
-            df["name"] = self.name
-            df["position"] = self.position
-            df["current_team_id"] = self.current_team_id
-            df["current_team_name"] = self.current_team_name
-            df["predicted_points"] = [self.predicted_points for i in range(len(df))]
-            df["current_value"] = self.current_value
-            df["squad_adjusted_value"] = self.squad_adjusted_value
-            df["chance_of_playing"] = self.chance_of_playing
-
-        return df
+        return history_to_dataframe(self.history,self.attributes())
 
     def __str__(self) -> str:
         return f"Player {self.id}, {self.name}, {self.position}, {self.current_team_name}\n"     
 class Team:
+
+    __slots__ = ("_id","_name","_code","current_player_ids","_history","_store","_store_version","_initial_elo","_current_elo","_current_form")
     
     _id:int
     _name:str
@@ -101,8 +146,11 @@ class Team:
         self._name = name
         self._code = code
         self.current_player_ids = []
-        self.history = None
-        self.initial_elo = 1000.0
+        self._history = None
+        self._store = None
+        self._store_version = -1
+        self._initial_elo = 1000.0
+        self.invalidate_cache()
 
     @property
     def id(self) -> int:
@@ -116,34 +164,71 @@ class Team:
     def name(self) -> str:
         return self._name 
 
+    @property
+    def history(self) -> pd.DataFrame:
+        #A history kept in a HistoryStore is sliced from the store when it is used after the store changed
+        if self._store is not None and self._store_version != self._store.version:
+            self._history = self._store.view(self._id)
+            self._store_version = self._store.version
+            self.invalidate_cache()
+        return self._history
+
+    @history.setter
+    def history(self, history:pd.DataFrame) -> None:
+        self._history = history
+        self._store = None
+        self.invalidate_cache()
+
+    def attach_history_store(self, store:"HistoryStore") -> None:
+        self._history = None
+        self._store = store
+        self._store_version = -1
+        self.invalidate_cache()
+
+    @property
+    def initial_elo(self) -> float:
+        return self._initial_elo
+
+    @initial_elo.setter
+    def initial_elo(self, initial_elo:float) -> None:
+        self._initial_elo = initial_elo
+        self.invalidate_cache()
+
+    def invalidate_cache(self) -> None:
+        #Must be called if the history is modified in place
+        self._current_elo = None
+        self._current_form = None
+
     @property
     def current_elo(self) -> float:
-        if self.history is None or len(self.history["elo_after_match"])<1:
-            return self.initial_elo                       
-        return self.history["elo_after_match"].values[-1]   
+        history = self.history
+        if self._current_elo is None:
+            if history is None or len(history["elo_after_match"])<1:
+                self._current_elo = self._initial_elo                       
+            else:
+                self._current_elo = history["elo_after_match"].values[-1]   
+        return self._current_elo
 
     @property
     def current_form(self) -> float:
-        if self.history is None or len(self.history["form"]) < 1:
-            return 0.5            
-        return self.history["form"].values[-1]                 
+        history = self.history
+        if self._current_form is None:
+            if history is None or len(history["form"]) < 1:
+                self._current_form = 0.5            
+            else:
+                self._current_form = history["form"].values[-1]                 
+        return self._current_form
+
+    def attributes(self) -> dict[str,Any]:
+        return {
+            "team_id": self.id,
+            "name": self.name,
+            "team_code": self.code,
+            "current_player_ids": self.current_player_ids,
+        }
 
     def to_dataframe(self) -> pd.DataFrame:
-
-        if self.history is None:
-            df = pd.DataFrame()
-            df["team_id"] = [self.id]
-            df["name"] = [self.name]
-            df["team_code"] = [self.code]
-            df["current_player_ids"] = [self.current_player_ids]
-        else:
-            df = pd.DataFrame(self.history)
-            df["team_id"] = self.id
-            df["name"] = self.name
-            df["team_code"] = self.code
-            df["current_player_ids"] = [self.current_player_ids for i in range(len(df))]
-            
-        return df
+        return history_to_dataframe(self.history,self.attributes())
 
     def __str__(self) -> str:
         return f"Team {self.id}, {self.name}, {len(self.current_player_ids)} current players\n"        
@@ -158,6 +243,8 @@ class Team:
         self.current_player_ids.append(player.id)
 
 class Squad:
+
+    __slots__ = ("_id","_name","_history","_current_bank","_current_free_transfers","_current_players")
     
     _id:int
     _name:str    
@@ -179,36 +266,56 @@ class Squad:
     def name(self) -> str:
         return self._name
 
+    @property
+    def history(self) -> pd.DataFrame:
+        return self._history
+
+    @history.setter
+    def history(self, history:pd.DataFrame) -> None:
+        self._history = history
+        self.invalidate_cache()
+
+    def invalidate_cache(self) -> None:
+        #Must be called if the history is modified in place
+        self._current_bank = None
+        self._current_free_transfers = None
+        self._current_players = None
+
     @property
     def current_bank(self) -> int:
-        if self.history is None:
-            return 1000        
-        return self.history["bank"].values[-1]
+        if self._current_bank is None:
+            if self._history is None:
+                self._current_bank = 1000        
+            else:
+                self._current_bank = self._history["bank"].values[-1]
+        return self._current_bank
 
     @property
     def current_free_transfers(self) -> int:
-        if self.history is None:
-            return 2        
-        return self.history["n_free_transfers"].values[-1]
+        if self._current_free_transfers is None:
+            if self._history is None:
+                self._current_free_transfers = 2        
+            else:
+                self._current_free_transfers = self._history["n_free_transfers"].values[-1]
+        return self._current_free_transfers
 
     @property
     def current_players(self) -> list[int]:
-        if self.history is None:
-            return []
-        return self.history["player_ids"].values[-1]       
+        if self._current_players is None:
+            if self._history is None:
+                self._current_players = []
+            else:
+                self._current_players = self._history["player_ids"].values[-1]       
+        return self._current_players
+
+    def attributes(self) -> dict[str,Any]:
+        return {
+            "squad_id": self.id,
+            "name": self.name,
+        }
 
     def to_dataframe(self) -> pd.DataFrame:
-
-        if self.history is None:
-            df = pd.DataFrame()
-            df["squad_id"] = [self.id]
-            df["name"] = [self.name]
-        else:
-            df = pd.DataFrame(self.history)
-            df["squad_id"] = self.id
-            df["name"] = self.name
-        
-        return df
+        return history_to_dataframe(self.history,self.attributes())
 
     def __str__(self) -> str:
 
@@ -217,8 +324,88 @@ class Squad:
         s += f"Player ids: {self.current_players}"
         return s
 
+class SquadOwnership:
+
+    #Acquisition round of every owned (squad id, player id) pair, nan for players owned since the first
+    #recorded round. The acquisition round is the round after the last round the player was not owned
+    acquisitions:dict[tuple[int,int],float]
+
+    def __init__(self) -> None:
+        self.acquisitions = {}
+        #(round, player ids) of every processed row, per squad
+        self._rows = {}
+
+    @classmethod
+    def from_squads(cls, squads:list[Squad]) -> "SquadOwnership":
+        ownership = cls()
+        for s in squads:
+            ownership.update(s)
+        return ownership
+
+    def update(self, squad:Squad) -> None:
+
+        #Only the rows added since the last update are processed. If a processed row is not the same in
+        #the history any more (e.g. a shorter or replaced history), the squad is processed again
+        if squad.history is None:
+            return
+        rows = [(int(r),tuple(int(p) for p in ids)) for r,ids in zip(squad.history["round"].values,squad.history["player_ids"].values)]
+        processed = self._rows.get(squad.id,[])
+        if rows[:len(processed)] != processed:
+            self.reset(squad.id)
+            processed = []
+
+        previous = set(processed[-1][1]) if len(processed) > 0 else None
+        last_round = processed[-1][0] if len(processed) > 0 else None
+
+        for round,ids in rows[len(processed):]:
+            players = set(ids)
+
+            for p in players:
+                if previous is None:
+                    self.acquisitions[(squad.id,p)] = np.nan
+                elif p not in previous:
+                    self.acquisitions[(squad.id,p)] = float(last_round + 1)
+            if previous is not None:
+                for p in previous - players:
+                    del self.acquisitions[(squad.id,p)]
+
+            previous = players
+            last_round = round
+
+        self._rows[squad.id] = rows
+
+    def reset(self, squad_id:int) -> None:
+        for key in [k for k in self.acquisitions if k[0] == squad_id]:
+            del self.acquisitions[key]
+        self._rows.pop(squad_id,None)
+
+    def owned(self, squad_id:int) -> tuple[np.ndarray,np.ndarray]:
+        #Player ids and acquisition rounds of the players owned by the squad
+        keys = [k for k in self.acquisitions if k[0] == squad_id]
+        return np.array([k[1] for k in keys], dtype=np.int64),np.array([self.acquisitions[k] for k in keys], dtype=np.float64)
+
+    def state(self) -> dict[str,Any]:
+        return {
+            "acquisitions": [[s,p,None if np.isnan(r) else r] for (s,p),r in self.acquisitions.items()],
+            "rows": {str(s):[[r,list(ids)] for r,ids in rows] for s,rows in self._rows.items()},
+        }
+
+    @classmethod
+    def from_state(cls, state:dict[str,Any]) -> "SquadOwnership":
+
+        ownership = cls()
+        ownership.acquisitions = {(int(s),int(p)):(np.nan if r is None else float(r)) for s,p,r in state["acquisitions"]}
+        ownership._rows = {int(s):[(int(r),tuple(int(p) for p in ids)) for r,ids in rows] for s,rows in state["rows"].items()}
+
+        return ownership
+
+    def __str__(self) -> str:
+        return f"Squad ownership of {len(self._rows)} squads and {len(self.acquisitions)} owned players\n"
+
 class Match:
 
+    __slots__ = ("_id","_round","home_team_name","away_team_name","home_team_id","away_team_id","home_goals","away_goals","finished","start_time","delta_elo","delta_form","expected_home_score","expected_away_score")
+
     _id:int
     _round:int
     home_team_name:str
@@ -260,24 +447,26 @@ class Match:
     def round(self) -> int:
         return self._round      
         
-    def to_dataframe(self):
-        df = pd.DataFrame()
-        df["id"] = [self.id]
-        df["round"] = [self.round]
-        df["home_team_id"] = [self.home_team_id]
-        df["away_team_id"] = [self.away_team_id]
-        df["home_team_name"] = [self.home_team_name]
-        df["away_team_name"] = [self.away_team_name]        
-        df["start_time"] = [self.start_time]
-        df["finished"] = [self.finished]
-        df["home_goals"] = [self.home_goals]
-        df["away_goals"] = [self.away_goals]
-        df["delta_elo"] = [self.delta_elo]
-        df["delta_form"] = [self.delta_form]
-        df["expected_home_score"] = [self.expected_home_score]
-        df["expected_away_score"] = [self.expected_away_score]
-
-        return df
+    def attributes(self) -> dict[str,Any]:
+        return {
+            "id": self.id,
+            "round": self.round,
+            "home_team_id": self.home_team_id,
+            "away_team_id": self.away_team_id,
+            "home_team_name": self.home_team_name,
+            "away_team_name": self.away_team_name,
+            "start_time": self.start_time,
+            "finished": self.finished,
+            "home_goals": self.home_goals,
+            "away_goals": self.away_goals,
+            "delta_elo": self.delta_elo,
+            "delta_form": self.delta_form,
+            "expected_home_score": self.expected_home_score,
+            "expected_away_score": self.expected_away_score,
+        }
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return history_to_dataframe(None,self.attributes())
 
     def __str__(self) -> str:
         s = f"Round {self.round}, {self.home_team_name} - {self.away_team_name}: "
@@ -287,6 +476,101 @@ class Match:
             s += f"starts {self.start_time}\n"
         return s
 
+class Season:
+
+    players:list[Player]
+    teams:list[Team]
+    matches:list[Match]
+
+    match_ids:np.ndarray
+    match_rounds:np.ndarray
+    match_home_team_ids:np.ndarray
+    match_away_team_ids:np.ndarray
+
+    player_history:"HistoryStore"
+
+    def __init__(self, players:list[Player], teams:list[Team], matches:list[Match]) -> None:
+        self.players = players
+        self.teams = teams
+        self.matches = matches
+        self.reindex()
+
+    def reindex(self) -> None:
+
+        #Must be called if entities are added to or removed from the lists. The player history store is
+        #built again from the player histories by the next stage that uses it
+        self.player_history = None
+        self._players_by_id = {p.id:p for p in self.players}
+        self._teams_by_id = {t.id:t for t in self.teams}
+        self._teams_by_code = {t.code:t for t in self.teams}
+        self._matches_by_id = {m.id:m for m in self.matches}
+
+        #Matches without a round (not yet scheduled) are not indexed by round
+        self._matches_by_round = {}
+        self._matches_by_team_round = {}
+        for m in self.matches:
+            if pd.isna(m.round):
+                continue
+            self._matches_by_round.setdefault(m.round,[]).append(m)
+            self._matches_by_team_round.setdefault((m.home_team_id,m.round),[]).append(m)
+            self._matches_by_team_round.setdefault((m.away_team_id,m.round),[]).append(m)
+
+        #Array backed match table, aligned with the order of the match list
+        self.match_ids = np.array([m.id for m in self.matches], dtype=np.int64)
+        self.match_rounds = np.array([m.round for m in self.matches], dtype=np.float64)
+        self.match_home_team_ids = np.array([m.home_team_id for m in self.matches], dtype=np.int64)
+        self.match_away_team_ids = np.array([m.away_team_id for m in self.matches], dtype=np.int64)
+
+    def get_player(self, player_id:int) -> Player:
+        try:
+            return self._players_by_id[player_id]
+        except KeyError:
+            raise ValueError(f"Player with id {player_id} not found in season") from None
+
+    def get_team(self, team_id:int) -> Team:
+        try:
+            return self._teams_by_id[team_id]
+        except KeyError:
+            raise ValueError(f"Team with id {team_id} not found in season") from None
+
+    def get_team_by_code(self, team_code:int) -> Team:
+        try:
+            return self._teams_by_code[team_code]
+        except KeyError:
+            raise ValueError(f"Team with code {team_code} not found in season") from None
+
+    def get_match(self, match_id:int) -> Match:
+        try:
+            return self._matches_by_id[match_id]
+        except KeyError:
+            raise ValueError(f"Match with id {match_id} not found in season") from None
+
+    def get_round_matches(self, round:int) -> list[Match]:
+        return self._matches_by_round.get(round,[])
+
+    def get_team_round_matches(self, team_id:int, round:int) -> list[Match]:
+        #Empty for a blank gameweek, more than one match for a double gameweek
+        return self._matches_by_team_round.get((team_id,round),[])
+
+    def fixture_index(self, first_round:int, last_round:int) -> tuple[np.ndarray,np.ndarray,np.ndarray]:
+
+        #Team id, round and opponent id of every match of every team in the rounds, grouped by team and in
+        #match order within a team. A team has no entries in a blank round and two in a double round
+        in_rounds = (self.match_rounds >= first_round) & (self.match_rounds <= last_round)
+        home = self.match_home_team_ids[in_rounds]
+        away = self.match_away_team_ids[in_rounds]
+        rounds = self.match_rounds[in_rounds].astype(np.int64)
+
+        team_ids = np.column_stack([home,away]).ravel()
+        opponent_ids = np.column_stack([away,home]).ravel()
+        rounds = np.repeat(rounds,2)
+
+        order = np.argsort(team_ids, kind="stable")
+        return team_ids[order],rounds[order],opponent_ids[order]
+
+    def __str__(self) -> str:
+        return f"Season with {len(self.players)} players, {len(self.teams)} teams and {len(self.matches)} matches\n"
+
 @dataclass
 class PlayerPointPredictor:
 
@@ -302,3 +586,9 @@ class PlayerPointPredictor:
         player_form = player.current_form
 
         return self.const + self.player_form_coeff*player_form + self.opponent_form_coeff*opponent_form + self.team_delta_elo_coeff*delta_elo
+
+    def predict_many(self, player_form:np.ndarray, team_elo:np.ndarray, opponent_form:np.ndarray, opponent_elo:np.ndarray) -> np.ndarray:
+
+        #Same as predict for arrays of (player, match) pairs
+        delta_elo = np.asarray(team_elo) - np.asarray(opponent_elo)
+        return self.const + self.player_form_coeff*np.asarray(player_form) + self.opponent_form_coeff*np.asarray(opponent_form) + self.team_delta_elo_coeff*delta_elo
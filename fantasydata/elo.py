@@ -0,0 +1,182 @@
+from typing import Any, Union
+from fantasydata.classes import Team, Match
+import pandas as pd
+import numpy as np
+import json
+
+def expected_elo_score(elo:Union[float,np.ndarray], opponent_elo:Union[float,np.ndarray]) -> Union[float,np.ndarray]:
+    return 1.0/(1.0+10**((opponent_elo-elo)/400.0))
+
+def margin_of_victory_multiplier(goal_difference:int) -> float:
+
+    #World Football Elo: a win by two goals counts 1.5 times, by three or more (11+N)/8 times
+    n = abs(goal_difference)
+    if n <= 1:
+        return 1.0
+    if n == 2:
+        return 1.5
+    return (11.0+n)/8.0
+
+class EloEngine:
+
+    k:float
+    home_advantage:float
+    margin_of_victory:bool
+
+    ratings:dict[int,float]
+    initial_ratings:dict[int,float]
+    history:dict[int,list[tuple[int,float,float,float]]]
+    applied:dict[int,tuple[float,float,float]]
+
+    def __init__(self, k:float = 30.0, home_advantage:float = 0.0, margin_of_victory:bool = False) -> None:
+
+        self.k = k
+        self.home_advantage = home_advantage
+        self.margin_of_victory = margin_of_victory
+
+        self.ratings = {}
+        self.initial_ratings = {}
+        #(match id, elo before match, elo after match, expected result) of every applied match, per team
+        self.history = {}
+        #(home elo, away elo, expected home score) before every applied match
+        self.applied = {}
+
+    def set_initial_ratings(self, teams:list[Team], initial_elo:pd.DataFrame) -> None:
+
+        #Teams that already have a rating (e.g. from a saved state) keep it
+        elo_by_name = dict(zip(initial_elo["team_name"].values,initial_elo["elo"].values))
+        for t in teams:
+            if t.id in self.ratings:
+                continue
+            try:
+                elo = float(elo_by_name[t.name])
+            except KeyError:
+                raise ValueError(f"No initial elo for team {t.name}") from None
+            self.ratings[t.id] = elo
+            self.initial_ratings[t.id] = elo
+            self.history[t.id] = []
+
+    def rating(self, team_id:int) -> float:
+        try:
+            return self.ratings[team_id]
+        except KeyError:
+            raise ValueError(f"Team with id {team_id} has no elo rating") from None
+
+    def apply(self, m:Match) -> None:
+
+        if not m.finished:
+            raise ValueError(f"Can not update elo ratings with unfinished match {m}")
+        if m.id in self.applied:
+            #A match applied before the state was saved only gets its values set again
+            home_elo,away_elo,home_expected_score = self.applied[m.id]
+            self._set_match_values(m,home_elo,away_elo,home_expected_score)
+            return
+
+        home_elo = self.rating(m.home_team_id)
+        away_elo = self.rating(m.away_team_id)
+
+        home_expected_score = expected_elo_score(home_elo+self.home_advantage,away_elo)
+        away_expected_score = expected_elo_score(away_elo,home_elo+self.home_advantage)
+
+        home_score = 0.5
+        if m.home_goals > m.away_goals:
+            home_score = 1.0
+        elif m.home_goals < m.away_goals:
+            home_score = 0.0
+        away_score = 1.0 - home_score
+
+        k = self.k
+        if self.margin_of_victory:
+            k *= margin_of_victory_multiplier(m.home_goals - m.away_goals)
+
+        new_home_elo = home_elo + k*(home_score - home_expected_score)
+        new_away_elo = away_elo + k*(away_score - away_expected_score)
+
+        self.ratings[m.home_team_id] = new_home_elo
+        self.ratings[m.away_team_id] = new_away_elo
+        self.history[m.home_team_id].append((int(m.id),home_elo,new_home_elo,home_expected_score))
+        self.history[m.away_team_id].append((int(m.id),away_elo,new_away_elo,1.0-home_expected_score))
+        self.applied[int(m.id)] = (home_elo,away_elo,home_expected_score)
+
+        self._set_match_values(m,home_elo,away_elo,home_expected_score)
+
+    def _set_match_values(self, m:Match, home_elo:float, away_elo:float, home_expected_score:float) -> None:
+        m.expected_home_score = home_expected_score
+        m.expected_away_score = 1.0 - home_expected_score
+        m.delta_elo = home_elo - away_elo
+
+    def apply_all(self, matches:list[Match]) -> int:
+
+        #The ratings are only updated by matches that are not applied yet, in the order of the list.
+        #Returns the number of newly applied matches
+        n = 0
+        for m in matches:
+            if not m.finished:
+                continue
+            n += m.id not in self.applied
+            self.apply(m)
+        return n
+
+    def expected_scores(self, home_team_ids:np.ndarray, away_team_ids:np.ndarray) -> np.ndarray:
+
+        #Expected score of the home team for many fixtures at once, with the current ratings
+        home_elo = np.array([self.rating(i) for i in home_team_ids], dtype=np.float64)
+        away_elo = np.array([self.rating(i) for i in away_team_ids], dtype=np.float64)
+        return expected_elo_score(home_elo+self.home_advantage,away_elo)
+
+    def predict(self, matches:list[Match]) -> None:
+
+        #Sets the expected scores and elo difference of upcoming matches
+        if len(matches) == 0:
+            return
+
+        home_ids = [m.home_team_id for m in matches]
+        away_ids = [m.away_team_id for m in matches]
+        expected = self.expected_scores(home_ids,away_ids)
+
+        for m,e,home_id,away_id in zip(matches,expected,home_ids,away_ids):
+            self._set_match_values(m,self.ratings[home_id],self.ratings[away_id],e)
+
+    def team_history(self, team_id:int) -> pd.DataFrame:
+
+        rows = self.history.get(team_id,[])
+        return pd.DataFrame({
+            "match_id": np.array([r[0] for r in rows], dtype=np.int64),
+            "elo_before_match": np.array([r[1] for r in rows], dtype=np.float64),
+            "elo_after_match": np.array([r[2] for r in rows], dtype=np.float64),
+            "expected_result": np.array([r[3] for r in rows], dtype=np.float64),
+        })
+
+    def state(self) -> dict[str,Any]:
+        return {
+            "k": self.k,
+            "home_advantage": self.home_advantage,
+            "margin_of_victory": self.margin_of_victory,
+            "ratings": {str(i):v for i,v in self.ratings.items()},
+            "initial_ratings": {str(i):v for i,v in self.initial_ratings.items()},
+            "history": {str(i):[list(r) for r in rows] for i,rows in self.history.items()},
+            "applied": {str(i):list(v) for i,v in self.applied.items()},
+        }
+
+    @classmethod
+    def from_state(cls, state:dict[str,Any]) -> "EloEngine":
+
+        engine = cls(state["k"],state["home_advantage"],state["margin_of_victory"])
+        engine.ratings = {int(i):float(v) for i,v in state["ratings"].items()}
+        engine.initial_ratings = {int(i):float(v) for i,v in state["initial_ratings"].items()}
+        engine.history = {int(i):[(int(r[0]),float(r[1]),float(r[2]),float(r[3])) for r in rows] for i,rows in state["history"].items()}
+        engine.applied = {int(i):tuple(float(x) for x in v) for i,v in state["applied"].items()}
+
+        return engine
+
+    def save(self, filename:str) -> None:
+        with open(filename,"w") as f:
+            json.dump(self.state(),f)
+
+    @classmethod
+    def load(cls, filename:str) -> "EloEngine":
+        with open(filename,"r") as f:
+            return cls.from_state(json.load(f))
+
+    def __str__(self) -> str:
+        return f"Elo engine with K={self.k}, home advantage {self.home_advantage}, {len(self.ratings)} teams and {len(self.applied)} applied matches\n"
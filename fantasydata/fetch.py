@@ -0,0 +1,224 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable
+from requests.adapters import HTTPAdapter
+import requests as req
+import asyncio
+import json
+import random
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class HttpClient:
+
+    pool_size:int
+    timeout:tuple[float,float]
+    keep_alive:bool
+    fast_json:bool
+    record_dir:str
+
+    def __init__(self, pool_size:int = 10, timeout:tuple[float,float] = (5.0,30.0), keep_alive:bool = True, fast_json:bool = True, record_dir:str = None) -> None:
+        if pool_size < 1:
+            raise ValueError(f"Connection pool size must be at least 1: {pool_size}")
+
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        #orjson is an optional dependency, the standard library decoder is used if it is not installed
+        self.fast_json = fast_json and orjson is not None
+        #If set, every successful response is stored for replay, see fantasydata.replay
+        self.record_dir = record_dir
+
+        #One session per client so that connections to the same host are reused between requests
+        self._session = req.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        if not keep_alive:
+            self._session.headers["Connection"] = "close"
+
+    def get(self, url:str, headers:dict[str,str] = None) -> req.Response:
+        return self._session.get(url, headers=headers, timeout=self.timeout)
+
+    def decode(self, content:bytes, decode:Callable[[bytes],Any] = None) -> Any:
+        if decode is not None:
+            return decode(content)
+        if self.fast_json:
+            return orjson.loads(content)
+        return json.loads(content)
+
+    def close(self) -> None:
+        self._session.close()
+
+class HttpStatusError(RuntimeWarning):
+
+    #Raised for a response with an unexpected status code. Client errors other than 429 (too many
+    #requests) are not retried, e.g. the picks of gameweeks before a squad was created do not exist
+    status_code:int
+
+    def __init__(self, message:str, status_code:int) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+    @property
+    def retryable(self) -> bool:
+        return not (400 <= self.status_code < 500) or self.status_code == 429
+
+@dataclass
+class FetchOutcome:
+
+    url:str
+    ok:bool
+    attempts:int
+    elapsed:float
+    error:str = ""
+    #Status code of the last failed attempt, None if it did not get a response
+    status_code:int = None
+
+@dataclass
+class FetchReport:
+
+    outcomes:list[FetchOutcome] = field(default_factory=list)
+    elapsed:float = 0.0
+
+    @property
+    def n_ok(self) -> int:
+        return sum(1 for o in self.outcomes if o.ok)
+
+    @property
+    def n_failed(self) -> int:
+        return len(self.outcomes) - self.n_ok
+
+    @property
+    def n_retries(self) -> int:
+        return sum(o.attempts - 1 for o in self.outcomes)
+
+    @property
+    def failed(self) -> list[FetchOutcome]:
+        return [o for o in self.outcomes if not o.ok]
+
+    def __str__(self) -> str:
+        s = f"{len(self.outcomes)} requests in {self.elapsed:.2f} s: {self.n_ok} ok, {self.n_failed} failed, {self.n_retries} retries\n"
+        for o in self.failed:
+            s += f"Failed after {o.attempts} attempts: {o.url} ({o.error})\n"
+        return s
+
+class TokenBucket:
+
+    rate:float
+    capacity:float
+
+    def __init__(self, rate:float, capacity:float) -> None:
+        if rate <= 0.0:
+            raise ValueError(f"Token bucket rate must be positive: {rate}")
+        if capacity < 1.0:
+            raise ValueError(f"Token bucket capacity must be at least 1: {capacity}")
+
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = None
+        self._loop = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last)*self.rate)
+        self._last = now
+
+    async def acquire(self) -> None:
+
+        #The waiting tasks are served in order. The lock is created lazily so that it belongs to the
+        #running event loop, every fetch_all call runs in a new loop
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1.0:
+                await asyncio.sleep((1.0 - self._tokens)/self.rate)
+                self._refill()
+            self._tokens -= 1.0
+
+class FetchEngine:
+
+    max_concurrency:int
+    max_retries:int
+    backoff_base:float
+    backoff_max:float
+
+    def __init__(self, fetch:Callable[[str],Any], max_concurrency:int = 10, rate:float = 20.0, burst:float = 20.0, max_retries:int = 4, backoff_base:float = 0.5, backoff_max:float = 8.0) -> None:
+        if max_concurrency < 1:
+            raise ValueError(f"Max concurrency must be at least 1: {max_concurrency}")
+        if max_retries < 0:
+            raise ValueError(f"Max retries is negative: {max_retries}")
+
+        self._fetch = fetch
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._bucket = TokenBucket(rate,burst)
+
+    def backoff_time(self, attempt:int) -> float:
+        #Exponential backoff with full jitter
+        return random.uniform(0.0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    async def _fetch_one(self, url:str, semaphore:asyncio.Semaphore, executor:ThreadPoolExecutor, results:dict[str,Any]) -> FetchOutcome:
+
+        loop = asyncio.get_running_loop()
+        t0 = time.monotonic()
+        error = ""
+        status_code = None
+
+        for attempt in range(self.max_retries+1):
+
+            async with semaphore:
+                await self._bucket.acquire()
+                try:
+                    results[url] = await loop.run_in_executor(executor,self._fetch,url)
+                    return FetchOutcome(url,True,attempt+1,time.monotonic()-t0)
+                except HttpStatusError as e:
+                    error = f"{type(e).__name__}: {e}"
+                    status_code = e.status_code
+                    if not e.retryable:
+                        return FetchOutcome(url,False,attempt+1,time.monotonic()-t0,error,status_code)
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                    status_code = None
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(self.backoff_time(attempt))
+
+        return FetchOutcome(url,False,self.max_retries+1,time.monotonic()-t0,error,status_code)
+
+    async def fetch_all_async(self, urls:list[str]) -> tuple[dict[str,Any],FetchReport]:
+
+        t0 = time.monotonic()
+        results = {}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        #The blocking requests run in a dedicated pool sized to the concurrency limit
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            tasks = [self._fetch_one(url,semaphore,executor,results) for url in urls]
+            outcomes = await asyncio.gather(*tasks)
+
+        report = FetchReport(list(outcomes),time.monotonic()-t0)
+        return results,report
+
+    def fetch_all(self, urls:list[str]) -> tuple[dict[str,Any],FetchReport]:
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.fetch_all_async(urls))
+
+        #Already inside an event loop (e.g. a notebook), run the engine in its own thread
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run,self.fetch_all_async(urls)).result()
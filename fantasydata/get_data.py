@@ -1,27 +1,89 @@
-from concurrent.futures import ThreadPoolExecutor
-from typing import Any
+from typing import Any, Callable
 import pandas as pd
-import requests as req
-import json
 from fantasydata.classes import Player, Team, Squad, Match
+from fantasydata.fetch import FetchEngine, FetchReport, HttpClient, HttpStatusError
+from fantasydata.cache import ResponseCache
+from fantasydata.replay import record_response
+from functools import partial
 import fantasydata.utility as ut
-import time
 import numpy as np
+import warnings
+import json
 
-def get_data(url:str) -> dict[str,Any]:
-        
-    r = req.get(url)
-    if r.status_code != 200:
-        raise RuntimeWarning(f"Error retreiving data from {url}, statuscode: {r.status_code}")
-    
-    res = json.loads(r.content)
+#Shared by all requests to the API, see configure_client
+_client = HttpClient()
+
+def configure_client(pool_size:int = 10, timeout:tuple[float,float] = (5.0,30.0), keep_alive:bool = True, fast_json:bool = True, record_dir:str = None) -> HttpClient:
+
+    global _client
+    _client.close()
+    _client = HttpClient(pool_size,timeout,keep_alive,fast_json,record_dir)
+
+    return _client
+
+#Fields of the players in bootstrap-static that are used, the other fields are dropped while decoding
+BOOTSTRAP_PLAYER_COLUMNS = ["id","web_name","element_type","team_code","now_cost","chance_of_playing_next_round","total_points","minutes"]
+
+def _keep_player_columns(pairs:list[tuple[str,Any]]) -> dict[str,Any]:
+    d = dict(pairs)
+    if "element_type" not in d:
+        return d
+    return {k:d[k] for k in BOOTSTRAP_PLAYER_COLUMNS if k in d}
+
+def decode_bootstrap(content:bytes) -> dict[str,Any]:
+
+    #Every player object of bootstrap-static has almost a hundred fields. Only the used ones are kept
+    #while the payload is decoded, so the full dict of every player is never held in memory at once
+    return json.loads(content, object_pairs_hook=_keep_player_columns)
+
+def get_data(url:str, cache:ResponseCache = None, decode:Callable[[bytes],Any] = None) -> dict[str,Any]:
+
+    content = None
+    headers = {}
+    if cache is not None:
+        content = cache.get_content(url)
+        if content is None:
+            headers = cache.conditional_headers(url)
+
+    if content is None:
+        r = _client.get(url, headers=headers)
+        if cache is not None and r.status_code == 304:
+            content = cache.revalidate_content(url)
+            if content is None:
+                r = _client.get(url)
+
+    if content is not None:
+        res = _client.decode(content, decode)
+    else:
+        if r.status_code != 200:
+            raise HttpStatusError(f"Error retreiving data from {url}, statuscode: {r.status_code}", r.status_code)
+        #Decoded before it is stored, so that a broken body is not cached
+        content = r.content
+        res = _client.decode(content, decode)
+        if cache is not None:
+            cache.put(url, content, etag=r.headers.get("ETag"), last_modified=r.headers.get("Last-Modified"))
+
+    #Responses served from the cache are recorded too, so that a recording is complete
+    if _client.record_dir is not None:
+        record_response(_client.record_dir, url, content)
 
     return res
 
-def retreive_players_and_teams(url_base:str) -> tuple[list[Player],list[Team]]:
-   
+def retreive_players_and_teams(url_base:str, cache:ResponseCache = None) -> tuple[list[Player],list[Team]]:
+
+    players,teams,_ = retreive_players_teams_and_round(url_base,cache)
+    return players,teams
+
+def retreive_players_teams_and_round(url_base:str, cache:ResponseCache = None) -> tuple[list[Player],list[Team],int]:
+
+    #The current round can be passed on to retreive_squad, so bootstrap-static is only downloaded once
     url = f"{url_base}bootstrap-static/"    
-    res = get_data(url)
+    res = get_data(url, cache, decode_bootstrap)
+    players,teams = players_and_teams_from_bootstrap(res)
+
+    return players,teams,get_current_round(res)
+
+def players_and_teams_from_bootstrap(res:dict[str,Any]) -> tuple[list[Player],list[Team]]:
 
     #fixture_data = res["events"]
     
@@ -38,97 +100,102 @@ def retreive_players_and_teams(url_base:str) -> tuple[list[Player],list[Team]]:
         t = Team(_id,name,code)
         teams.append(t)
 
-    player_data = res["elements"]
+    #Only the needed columns of the elements block are extracted, as arrays
+    columns = BOOTSTRAP_PLAYER_COLUMNS[:6]
+    player_data = pd.DataFrame.from_records(res["elements"], columns=columns)
+    
+    #element_type: 1 = gkp, 2 = def, 3 = mid, 4 = fwd
+    positions = {1:"gkp", 2:"def", 3:"mid", 4:"fwd"}
+    teams_by_code = {t.code:t for t in teams}
+
     players = []    
-    for p in player_data:
+    for player_id,name,p_type,team_code,current_value,chance_of_playing in zip(*[player_data[c].values for c in columns]):
+        
+        if p_type not in positions:
+            raise ValueError(f"Unknown position {p_type} for player {player_id}")
+        pos = positions[p_type]
 
-        #if p["id"] == 237:
-        #    for k,v in p.items():
-        #        print(k,v)
-        #    a=b
+        if team_code not in teams_by_code:
+            raise ValueError(f"Team with code {team_code} not found in list") 
+        team = teams_by_code[team_code]
 
-        #element_type: 1 = gkp, 2 = def, 3 = mid, 4 = fwd
-        p_type = p["element_type"]
-        
-        if p_type == 1:
-            pos = "gkp"
-        elif p_type == 2:
-            pos = "def"
-        elif p_type == 3:
-            pos = "mid"
-        elif p_type == 4:
-            pos = "fwd"
-        else:
-            raise ValueError(f"Unknown position {p_type} for player {p}")
-        
-        player_id = p["id"]
         #real_name = p["first_name"]+" "+p["second_name"]
-        name = p["web_name"]
-        team = ut.get_team_from_code(teams,p["team_code"])
-        #value = p["now_cost"]
-        chance_of_playing = p["chance_of_playing_next_round"]
-
-        current_value = p["now_cost"]
         #tot_points = p["total_points"]
         #form = p["form"]
         #minutes = p["minutes"]
-        #assists = p["assists"]
-        #clean_sheets = p["clean_sheets"]
-        #goals_conceded = p["goals_conceded"]
-        #points_last_round = p["event_points"]
-        #goals_scored = p["goals_scored"]
 
-        player = Player(player_id,name,pos,team.id,team.name,current_value)
+        player = Player(int(player_id),name,pos,team.id,team.name,int(current_value))
         team.add_current_player(player)
 
-        if chance_of_playing is not None:
-            player.chance_of_playing = chance_of_playing*0.01
+        if chance_of_playing is not None and not np.isnan(chance_of_playing):
+            player.chance_of_playing = float(chance_of_playing)*0.01
 
         players.append(player)
 
     return players,teams
  
-def retreive_squad(url_base:str, squad_id:int) -> Squad:
+def get_current_round(res:dict[str,Any]) -> int:
 
-    history = pd.DataFrame()
+    #The events block of bootstrap-static has one entry per gameweek
+    current_round = 0
+    for event in res["events"]:
+        if event["is_current"]:
+            return int(event["id"])
+        if event["finished"]:
+            current_round = max(current_round,int(event["id"]))
 
-    for game_week in range(1,100):
+    return current_round
 
-        url = f"{url_base}entry/{squad_id}/event/{game_week}/picks/"
-        try:
-            res = get_data(url)
-        except RuntimeWarning:
-            break
-        
-        df = pd.DataFrame({k:[v] for k,v in res["entry_history"].items()})
-        df.rename(columns={"event":"round"},inplace=True)
+def squad_round_from_picks(res:dict[str,Any]) -> dict[str,Any]:
 
-        n_transfers = df["event_transfers"].values[0]
-        if n_transfers == 0 and res["active_chip"] != "wildcard":
-            n_free_transfers = 2
-        else:
-            n_free_transfers = 1
-        df["n_free_transfers"] = [n_free_transfers]
+    row = {("round" if k == "event" else k):v for k,v in res["entry_history"].items()}
 
-        chosen_player_ids = [pick["element"] for pick in res["picks"]]
+    n_transfers = row["event_transfers"]
+    if n_transfers == 0 and res["active_chip"] != "wildcard":
+        n_free_transfers = 2
+    else:
+        n_free_transfers = 1
+    row["n_free_transfers"] = n_free_transfers
 
-        if len(chosen_player_ids) != 15:
-            raise RuntimeError(f"All existing players not found, {len(chosen_player_ids)} players in list!")
-        
-        df["player_ids"] = [chosen_player_ids]
-        
-        history = pd.concat([history,df])
-        time.sleep(0.1)
+    chosen_player_ids = [pick["element"] for pick in res["picks"]]
+
+    if len(chosen_player_ids) != 15:
+        raise RuntimeError(f"All existing players not found, {len(chosen_player_ids)} players in list!")
+    
+    row["player_ids"] = chosen_player_ids
+
+    return row
 
-    history.reset_index(drop=True, inplace=True)
+def retreive_squad(url_base:str, squad_id:int, cache:ResponseCache = None, current_round:int = None, engine:FetchEngine = None) -> Squad:
+
+    if current_round is None:
+        res = get_data(f"{url_base}bootstrap-static/", cache, decode_bootstrap)
+        current_round = get_current_round(res)
+
+    if engine is None:
+        engine = FetchEngine(partial(get_data,cache=cache))
+
+    urls = [f"{url_base}entry/{squad_id}/event/{game_week}/picks/" for game_week in range(1,current_round+1)]
+    results,report = engine.fetch_all(urls)
+
+    outcomes = {o.url:o for o in report.outcomes}
+    rows = []
+    for url in urls:
+        if url in results:
+            rows.append(squad_round_from_picks(results[url]))
+        elif len(rows) != 0 or outcomes[url].status_code != 404:
+            #Gameweeks before the squad was created do not exist (404), any other failure is an error
+            raise RuntimeError(f"Unable to get squad history from {url}\n{report}")
+
+    history = pd.DataFrame(rows)
+
+    if cache is not None:
+        print(f"Response cache: {cache}",end="")
 
     s = Squad(squad_id,"my_squad",history=history)        
     return s
 
-def retreive_player_history(url_base:str, player:Player, wait_time:float) -> None:            
-
-    url = f"{url_base}element-summary/{player.id}/"
-    res = get_data(url)
+def set_player_history(player:Player, res:dict[str,Any]) -> None:
 
     #Keys:
     #'fixtures' is upcoming matches
@@ -146,31 +213,45 @@ def retreive_player_history(url_base:str, player:Player, wait_time:float) -> Non
         df = pd.DataFrame(history)
         df = df.drop(columns=["element"])
         player.history = df
-    
-    time.sleep(wait_time)
 
-def add_player_history(url_base:str, players:list[Player],wait_time:float) -> None:
+def retreive_player_history(url_base:str, player:Player, cache:ResponseCache = None) -> None:            
 
-    t0 = time.time()
-    with ThreadPoolExecutor(max_workers=6) as threadPool:
-        for p in players:        
-            threadPool.submit(retreive_player_history,url_base,p,wait_time)
+    url = f"{url_base}element-summary/{player.id}/"
+    res = get_data(url, cache)
+    set_player_history(player,res)
 
-    for p in players:
-        if p.history is None:
-            print("trying again for ",p)
-            retreive_player_history(url_base,p,wait_time)
-            if p.history is None:
-                print(f"Unable to get history for player {p}\n")
+def engine_from_wait_time(wait_time:float, cache:ResponseCache = None) -> FetchEngine:
+
+    #The old interface slept wait_time after every request in each of 6 threads
+    warnings.warn("wait_time is deprecated, pass engine=FetchEngine(...) to set the request rate", DeprecationWarning, stacklevel=3)
+    rate = 6.0/wait_time if wait_time > 0.0 else 1e9
+    return FetchEngine(partial(get_data,cache=cache), max_concurrency=6, rate=rate, burst=6.0)
+
+def add_player_history(url_base:str, players:list[Player], wait_time:float = None, *, engine:FetchEngine = None, cache:ResponseCache = None) -> FetchReport:
+
+    #An engine that is passed in fetches with its own callable, e.g. FetchEngine(partial(get_data,cache=cache))
+    if engine is None and wait_time is not None:
+        engine = engine_from_wait_time(wait_time,cache)
+    if engine is None:
+        engine = FetchEngine(partial(get_data,cache=cache))
 
-    t1 = time.time()
+    urls = {f"{url_base}element-summary/{p.id}/":p for p in players}
+    results,report = engine.fetch_all(list(urls.keys()))
 
-    print(f"Time used to get player history: {t1-t0}")
+    for url,res in results.items():
+        set_player_history(urls[url],res)
 
-def retreive_matches(url_base:str, teams:list[Team]) -> list[Match]:
+    for o in report.failed:
+        print(f"Unable to get history for player {urls[o.url]}",end="")
+
+    print(f"Player history: {report}",end="")
+
+    return report
+
+def retreive_matches(url_base:str, teams:list[Team], cache:ResponseCache = None) -> list[Match]:
     
     url = f"{url_base}fixtures/"
-    res = get_data(url)
+    res = get_data(url, cache)
 
     matches = []
     for match in res:
@@ -205,12 +286,77 @@ def retreive_matches(url_base:str, teams:list[Team]) -> list[Match]:
 
     return matches
  
-def retreive_raw_common_data(url_base:str, wait_time:float = 0.2) -> tuple[list[Player],list[Team],list[Match]]:
+def player_summary_changed(previous:Player, summary:dict[str,Any], last_finished_match_id:int = None) -> bool:
+
+    if previous.current_value != summary["now_cost"]:
+        return True
+
+    has_history = previous.history is not None and "fixture" in previous.history.keys() and not previous.history["fixture"].isna().all()
+
+    #A player who did not play still gets a new row (0 minutes, 0 points) for every match of the team,
+    #so the history has changed if the last finished match of the player's team is not in it
+    if last_finished_match_id is not None and (not has_history or last_finished_match_id not in previous.history["fixture"].values):
+        return True
+
+    if not has_history:
+        return summary["total_points"] != 0 or summary["minutes"] != 0
+
+    total_points = previous.history["total_points"].sum()
+    minutes = previous.history["minutes"].sum()
+
+    return total_points != summary["total_points"] or minutes != summary["minutes"]
+
+def refresh_raw_common_data(url_base:str, directory:str, suffix:str = "raw", *, engine:FetchEngine = None, cache:ResponseCache = None) -> tuple[list[Player],list[Team],list[Match]]:
+
+    #Incremental version of retreive_raw_common_data, starting from data saved by ut.save_all_data
+    previous_players,_,_ = ut.read_main_data_from_csv(directory,suffix)
+    previous_players = {p.id:p for p in previous_players}
+
+    url = f"{url_base}bootstrap-static/"    
+    res = get_data(url, cache, decode_bootstrap)
+    players,teams = players_and_teams_from_bootstrap(res)
+    summary = {p["id"]:p for p in res["elements"]}
+
+    #The matches are sorted by start time, the last finished match of every team is kept
+    matches = retreive_matches(url_base,teams,cache)
+    last_finished_match_ids = {}
+    for m in matches:
+        if m.finished:
+            last_finished_match_ids[m.home_team_id] = m.id
+            last_finished_match_ids[m.away_team_id] = m.id
+
+    changed_players = []
+    for p in players:
+        previous = previous_players.get(p.id)
+        if previous is None or player_summary_changed(previous,summary[p.id],last_finished_match_ids.get(p.current_team_id)):
+            changed_players.append(p)
+        else:
+            p.history = previous.history
+
+    print(f"{len(changed_players)} of {len(players)} players changed since the previous download")
+
+    #element-summary returns the full history of the season, so it replaces the previous history.
+    #Players that could not be downloaded keep their previous history
+    report = add_player_history(url_base,changed_players,engine=engine,cache=cache)
+    failed_urls = {o.url for o in report.failed}
+    for p in changed_players:
+        if p.id in previous_players and f"{url_base}element-summary/{p.id}/" in failed_urls:
+            p.history = previous_players[p.id].history
+
+    if cache is not None:
+        print(f"Response cache: {cache}",end="")
+
+    return players,teams,matches
+
+def retreive_raw_common_data(url_base:str, wait_time:float = None, *, engine:FetchEngine = None, cache:ResponseCache = None) -> tuple[list[Player],list[Team],list[Match]]:
+
+    players,teams = retreive_players_and_teams(url_base,cache) 
+    add_player_history(url_base,players,wait_time,engine=engine,cache=cache)
 
-    players,teams = retreive_players_and_teams(url_base) 
-    add_player_history(url_base,players,wait_time)
+    matches = retreive_matches(url_base,teams,cache)
 
-    matches = retreive_matches(url_base,teams)
+    if cache is not None:
+        print(f"Response cache: {cache}",end="")
 
     return players,teams,matches
 
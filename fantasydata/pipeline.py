@@ -0,0 +1,210 @@
+from fantasydata.classes import Player, Team, Match, Squad, Season, SquadOwnership
+from fantasydata.elo import EloEngine
+import fantasydata.process_data as pr
+import pandas as pd
+import numpy as np
+import json
+import os
+
+#History columns that the derived player columns depend on. A row is only reused if these are unchanged:
+#team_id and round depend on the fixture and opponent, form on the points and the team points on the minutes
+INPUT_COLUMNS = ["fixture","opponent_team","total_points","minutes"]
+
+class IncrementalPipeline:
+
+    directory:str
+    k:float
+    home_advantage:float
+    margin_of_victory:bool
+
+    rows:dict[str,np.ndarray]
+    elo_engine:EloEngine
+    match_results:dict[int,tuple[int,int]]
+    initial_elo:dict[str,float]
+    ownership:SquadOwnership
+
+    def __init__(self, directory:str, k:float = 30.0, home_advantage:float = 0.0, margin_of_victory:bool = False) -> None:
+
+        self.directory = directory
+        self.k = k
+        self.home_advantage = home_advantage
+        self.margin_of_victory = margin_of_victory
+
+        self.rows = None
+        self.elo_engine = None
+        self.match_results = {}
+        self.initial_elo = {}
+        self.ownership = SquadOwnership()
+
+        if os.path.exists(self._path("pipeline_rows.npz")):
+            with np.load(self._path("pipeline_rows.npz")) as f:
+                self.rows = {k:f[k] for k in f.files}
+
+        if os.path.exists(self._path("pipeline_elo.json")):
+            with open(self._path("pipeline_elo.json"),"r") as f:
+                state = json.load(f)
+            if "ownership" in state:
+                self.ownership = SquadOwnership.from_state(state["ownership"])
+            engine = EloEngine.from_state(state["engine"])
+            #An engine with other parameters must be replayed from the start
+            if (engine.k,engine.home_advantage,engine.margin_of_victory) == (k,home_advantage,margin_of_victory):
+                self.elo_engine = engine
+                self.match_results = {int(i):tuple(r) for i,r in state["match_results"].items()}
+                self.initial_elo = state.get("initial_elo",{})
+
+    def _path(self, name:str) -> str:
+        return f"{self.directory}{name}"
+
+    def _reusable_rows(self, player_ids:np.ndarray, positions:np.ndarray, inputs:dict[str,np.ndarray], group:np.ndarray, n_players:int) -> tuple[np.ndarray,np.ndarray,np.ndarray]:
+
+        #Returns, per row, the index of the same (player, position) row in the previous state (-1 if none),
+        #whether the row can be reused and, per player, the number of rows that are reused
+        if self.rows is None:
+            return np.full(len(player_ids),-1),np.zeros(len(player_ids),dtype=bool),np.zeros(n_players,dtype=np.int64)
+
+        previous_index = pd.MultiIndex.from_arrays([self.rows["player_id"],self.rows["position"]])
+        index = previous_index.get_indexer(pd.MultiIndex.from_arrays([player_ids,positions]))
+
+        found = index >= 0
+        equal = found.copy()
+        for c in INPUT_COLUMNS:
+            previous = self.rows[c][index]
+            equal &= (previous == inputs[c]) | (np.isnan(previous) & np.isnan(inputs[c]))
+
+        #A player is only extended if every previous row is unchanged. Players that had a single match
+        #were given their current team and players with missing fixtures are always recomputed
+        previous_counts = pd.Series(self.rows["player_id"]).value_counts()
+        n_previous = previous_counts.reindex(player_ids, fill_value=0).values
+        n_equal = np.bincount(group, weights=equal, minlength=n_players)
+        has_missing = np.bincount(group, weights=np.isnan(inputs["fixture"]), minlength=n_players) > 0
+
+        first_rows = np.flatnonzero(np.r_[True, group[1:] != group[:-1]]) if len(group) > 0 else np.zeros(0,dtype=np.int64)
+        n_previous = n_previous[first_rows]
+        extend = (n_equal == n_previous) & (n_previous >= 2) & ~has_missing
+
+        reuse = extend[group] & equal
+        n_reused = np.where(extend, n_previous, 0)
+
+        return index,reuse,n_reused
+
+    def _elo_engine(self, matches:list[Match], initial_elo:pd.DataFrame) -> EloEngine:
+
+        #The ratings are replayed from the start if the result of an applied match or an initial rating
+        #has changed, the engine keeps the ratings it already has
+        results = {int(m.id):(int(m.home_goals),int(m.away_goals)) for m in matches if m.finished}
+        initial = {str(name):float(elo) for name,elo in zip(initial_elo["team_name"].values,initial_elo["elo"].values)}
+        engine = self.elo_engine
+        if engine is not None and any(results.get(i) != r for i,r in self.match_results.items()):
+            engine = None
+        if engine is not None and initial != self.initial_elo:
+            engine = None
+        if engine is None:
+            engine = EloEngine(self.k,self.home_advantage,self.margin_of_victory)
+
+        self.match_results = results
+        self.initial_elo = initial
+        return engine
+
+    def run(self, players:list[Player], teams:list[Team], matches:list[Match], squad:Squad, initial_elo:pd.DataFrame, season:Season = None) -> dict[str,int]:
+
+        if season is None:
+            season = Season(players,teams,matches)
+
+        #The store is built from the current player histories for this run only, see add_calculated_attributes
+        season.player_history = None
+        store = pr.player_history_store(players,season)
+        group = store.group_index
+        positions = store.positions
+        player_ids = store.ids[group]
+        n_players = len(store.ids)
+        inputs = {c:store.column(c).astype(np.float64) for c in INPUT_COLUMNS}
+
+        index,reuse,n_reused = self._reusable_rows(player_ids,positions,inputs,group,n_players)
+        compute = ~reuse
+
+        team_ids = np.full(len(store),np.nan)
+        rounds = np.full(len(store),np.nan)
+        sums = np.full(len(store),np.nan)
+        if reuse.any():
+            team_ids[reuse] = self.rows["team_id"][index[reuse]]
+            rounds[reuse] = self.rows["round"][index[reuse]]
+            sums[reuse] = self.rows["form_sum"][index[reuse]]
+
+        #Team and round of the new rows and of the rows of recomputed players
+        fixtures = inputs["fixture"].copy()
+        has_missing = np.bincount(group, weights=np.isnan(fixtures), minlength=n_players) > 0
+        fixtures[has_missing[group]] = np.nan
+        single = (np.bincount(group, minlength=n_players) == 1)[group]
+        current_team_ids = np.array([season.get_player(int(i)).current_team_id for i in store.ids], dtype=np.float64)[group]
+
+        team_ids[compute],rounds[compute] = pr.team_and_round_from_fixtures(fixtures[compute],inputs["opponent_team"][compute],player_ids[compute],single[compute],current_team_ids[compute],season)
+
+        #The form recursion continues from the last reused row of each player
+        initial = np.zeros(n_players)
+        extended = n_reused > 0
+        last_reused = store.starts[extended] + n_reused[extended] - 1
+        initial[extended] = sums[last_reused]
+        segment_positions = positions - n_reused[group]
+        sums[compute] = pr.ewma_sums(inputs["total_points"][compute],segment_positions[compute],initial=initial[group][compute])
+
+        store.set_columns({
+            "team_id": team_ids if np.isnan(team_ids).any() else team_ids.astype(np.int64),
+            "round": rounds if np.isnan(rounds).any() else rounds.astype(np.int64),
+            "form": sums/(1.0-pr.FORM_COEFF**(positions+1)),
+        })
+
+        #Players read from file without matches have a single row of missing values
+        for p in players:
+            if p.id not in store and p.history is not None:
+                pr.add_previous_team_to_player(p,matches,season)
+                pr.add_rounds_to_player(p,matches,season)
+                pr.add_player_form(p)
+
+        #The team tables have two rows per finished match and are recomputed in one vectorized pass
+        pr.add_result_and_form_to_team(teams,matches,season)
+
+        engine = self._elo_engine(matches,initial_elo)
+        n_applied = len(engine.applied)
+        pr.add_team_elo(teams,matches,initial_elo,season,engine)
+
+        pr.add_sum_points_to_teams(teams,players,season)
+        pr.add_squad_adjusted_player_value(players,squad,season,self.ownership)
+        season.player_history = None
+
+        self.elo_engine = engine
+        self.rows = {
+            "player_id": player_ids,
+            "position": positions,
+            **inputs,
+            "team_id": team_ids,
+            "round": rounds,
+            "form_sum": sums,
+        }
+        self.save()
+
+        return {
+            "rows": int(len(store)),
+            "reused_rows": int(reuse.sum()),
+            "computed_rows": int(compute.sum()),
+            "extended_players": int(extended.sum()),
+            "recomputed_players": int((~extended).sum()),
+            "new_elo_matches": len(engine.applied) - n_applied,
+        }
+
+    def save(self) -> None:
+
+        os.makedirs(self.directory, exist_ok=True)
+        np.savez(self._path("pipeline_rows.npz"),**self.rows)
+
+        state = {
+            "engine": self.elo_engine.state(),
+            "match_results": {str(i):list(r) for i,r in self.match_results.items()},
+            "initial_elo": self.initial_elo,
+            "ownership": self.ownership.state(),
+        }
+        with open(self._path("pipeline_elo.json"),"w") as f:
+            json.dump(state,f)
+
+    def __str__(self) -> str:
+        n_rows = 0 if self.rows is None else len(self.rows["player_id"])
+        return f"Incremental pipeline in {self.directory} with {n_rows} player rows\n"
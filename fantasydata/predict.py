@@ -1,7 +1,9 @@
-from fantasydata.classes import Player, Match, Team, PlayerPointPredictor
+from dataclasses import dataclass
+from fantasydata.classes import Player, Match, Team, PlayerPointPredictor, Season
+from fantasydata.store import HistoryStore
 import fantasydata.utility as ut
+import pandas as pd
 import numpy as np
-import statsmodels.api as sm
 
 def linear_model_to_csv(directory:str, model:PlayerPointPredictor) -> None:
 
@@ -28,160 +30,252 @@ def read_linear_model(directory:str, filename:str) -> PlayerPointPredictor:
 
     return PlayerPointPredictor(const,player_form,opponent_team_form,team_delta_elo)
 
-def estimate_linear_model(players:list[Player], teams:list[Team]) -> tuple[PlayerPointPredictor,PlayerPointPredictor]:
-    
-    player_points = []
-    player_form = []
-    team_delta_elo = []
-    opponent_form = []
+def linear_model_features(players:list[Player], teams:list[Team], season:Season = None, verbose:bool = False) -> tuple[np.ndarray,np.ndarray]:
+
+    #The predictors (player form and opponent form before the match, team elo difference) and the points of
+    #every played match after the third of the best players, joined with the team histories in one pass
+    if season is None:
+        season = Season(players,teams,[])
+
+    #The store of the season is only set while the attributes are calculated, otherwise one is built from
+    #the current player histories
+    columns = ["fixture","opponent_team","team_id","total_points","form","minutes"]
+    store = season.player_history
+    if store is None:
+        store = HistoryStore.from_entities([p for p in players if ut.has_history(p)],"player_id")
+    if not all(c in store.table.keys() for c in columns):
+        store = None
+
+    #Number of rows and total points of every player, from the columnar history table of the season
+    #for the players in it. Players without matches are not in the table and are never selected
+    in_store = np.array([store is not None and p.id in store for p in players], dtype=bool)
+    starts = np.zeros(len(players), dtype=np.int64)
+    lengths = np.array([0 if s or p.history is None else len(p.history) for p,s in zip(players,in_store)], dtype=np.int64)
+    sums = [0 if s or p.history is None else np.sum(p.history["total_points"].values) for p,s in zip(players,in_store)]
+    if in_store.any():
+        index = np.searchsorted(store.ids,[p.id for p,s in zip(players,in_store) if s])
+        starts[in_store] = store.starts[index]
+        lengths[in_store] = store.stops[index] - store.starts[index]
+        store_sums = np.add.reduceat(store.column("total_points"),store.starts)[index]
+        for k,v in zip(np.flatnonzero(in_store),store_sums):
+            sums[k] = v
+
+    #Players sorted by their total points (the same order as sorting the players), then the best ones selected
+    order = sorted(range(len(players)),key=lambda k: sums[k],reverse=True)
+    order = [k for k in order if lengths[k]>=3 and sums[k]/lengths[k] >= 2]
+    if verbose:
+        print(f"{len(order)} best players used in fit")
+
+    lengths = lengths[order]
+    offsets = np.cumsum(lengths)-lengths
+    positions = np.arange(lengths.sum()) - np.repeat(offsets,lengths)
+    if len(order) == 0 or not in_store[order].all():
+        fixtures,opponent_ids,team_ids,points,form,minutes = [np.concatenate([players[k].history[c].values for k in order]) if len(order) > 0 else np.zeros(0) for c in columns]
+    else:
+        player_rows = np.repeat(starts[order],lengths) + positions
+        fixtures,opponent_ids,team_ids,points,form,minutes = [store.column(c)[player_rows] for c in columns]
+
+    #If the player didn't play the round, we skip it (assume we can know if the player is unavailable)
+    rows = np.flatnonzero((positions >= 3) & (minutes != 0))
+
+    #Row of the first (team, match) of the team histories
+    team_list_ids = np.unique(np.r_[team_ids[rows],opponent_ids[rows]]).astype(np.int64)
+    team_list = [season.get_team(int(i)) for i in team_list_ids]
+    team_lengths = np.array([len(t.history) for t in team_list], dtype=np.int64)
+    team_starts = np.cumsum(team_lengths)-team_lengths
+    team_history = pd.DataFrame({
+        "team_id": np.repeat(team_list_ids,team_lengths),
+        "match_id": np.concatenate([t.history["match_id"].values for t in team_list]),
+    }).drop_duplicates(keep="first")
+    team_index = pd.MultiIndex.from_arrays([team_history["team_id"].values,team_history["match_id"].values])
+    elo_before_match = np.concatenate([t.history["elo_before_match"].values for t in team_list])
+    team_form = np.concatenate([t.history["form"].values for t in team_list])
+
+    def match_rows(ids:np.ndarray) -> np.ndarray:
+        i = team_index.get_indexer(pd.MultiIndex.from_arrays([ids.astype(np.int64),fixtures[rows].astype(np.int64)]))
+        if (i < 0).any():
+            k = np.flatnonzero(i < 0)[0]
+            raise ValueError(f"Match {int(fixtures[rows][k])} not found in the history of team {int(ids[k])}")
+        return team_history.index.values[i]
+
+    team_rows = match_rows(team_ids[rows])
+    opponent_rows = match_rows(opponent_ids[rows])
+
+    #The opponent form before the match, for the first match of the opponent this is the last form of its history
+    opponents = np.searchsorted(team_list_ids,opponent_ids[rows].astype(np.int64))
+    previous_rows = np.where(opponent_rows > team_starts[opponents], opponent_rows-1, team_starts[opponents]+team_lengths[opponents]-1)
+
+    player_form = form[rows-1]
+    opponent_form = team_form[previous_rows]
+    team_delta_elo = elo_before_match[team_rows] - elo_before_match[opponent_rows]
+
+    #Y is the actual outcome
+    Y = points[rows].reshape(-1, 1)
 
-    players = sorted(players,key=lambda p: np.sum(p.history["total_points"].values),reverse=True)
-    players = [p for p in players if len(p.history)>=3 and np.mean(p.history["total_points"].values) >= 2]
-    print(f"{len(players)} best players used in fit")
+    #We use the player form, opponent team form, and team elo difference to predict the player points
+    X = np.array([player_form,opponent_form,team_delta_elo]).T
+
+    return X,Y
+
+#Names of the coefficients of a fit, in the order of the design matrix with the constant first
+COEFFICIENT_NAMES = ["const","player_form","opponent_team_form","team_delta_elo"]
+#Methods of fit_linear_model, statsmodels is only imported when it is used
+FIT_METHODS = ["statsmodels","numpy"]
+
+@dataclass
+class LinearModelFit:
+
+    model:PlayerPointPredictor
+    coefficients:dict[str,float]
+    fitted:np.ndarray
+    rms:float
+    form_rms:float
+    r_squared:float
+    n_observations:int
+    summary:str
+
+    def __str__(self) -> str:
+        coeffs = ", ".join(f"{k} {v:.4g}" for k,v in self.coefficients.items())
+        return f"Linear model fitted to {self.n_observations} matches: {coeffs}, rms {self.rms:.4f} (form only {self.form_rms:.4f}), r squared {self.r_squared:.4f}\n"
+
+def fit_linear_model(X:np.ndarray, Y:np.ndarray, method:str = "statsmodels") -> LinearModelFit:
+
+    #Ordinary least squares with a constant. The numpy fit gives the same coefficients without
+    #importing statsmodels, but also without the statistics of the statsmodels summary
+    y = np.asarray(Y, dtype=np.float64).ravel()
+    names = COEFFICIENT_NAMES[:X.shape[1]+1]
+
+    if method == "statsmodels":
+        try:
+            import statsmodels.api as sm
+        except ImportError:
+            raise ImportError("Fitting with statsmodels requires statsmodels, install it with pip install statsmodels or use method='numpy'") from None
+
+        X2 = sm.add_constant(X)
+        est = sm.OLS(Y, X2).fit()
+        coeffs = np.asarray(est.params)
+        fitted = np.asarray(est.predict(X2))
+        r_squared = float(est.rsquared)
+        summary = str(est.summary())
+
+    elif method == "numpy":
+        X2 = np.column_stack([np.ones(len(X)),X])
+        coeffs = np.linalg.lstsq(X2,y,rcond=None)[0]
+        fitted = X2 @ coeffs
+        r_squared = float(1.0 - np.sum((y-fitted)**2)/np.sum((y-np.mean(y))**2))
+        summary = f"OLS fit with numpy least squares, {len(y)} observations, r squared {r_squared:.4f}\n"
+        summary += "".join(f"{k:<20}{c: .6g}\n" for k,c in zip(names,coeffs))
 
-    for p in players:
+    else:
+        raise ValueError(f"Unknown fit method {method}, use one of {FIT_METHODS}")
 
-        fixtures = p.history["fixture"].values
-        opponent_id = p.history["opponent_team"].values
-        team_id = p.history["team_id"].values
-        points = p.history["total_points"].values
-        form = p.history["form"].values
-        minutes = p.history["minutes"].values
-
-        for i in range(3,len(p.history)):
-            
-            #if the player didn't play the round, we skip it (assume we can know if the player is unavailable)
-            if minutes[i] == 0:                
-                continue
-            
-            #Points this round
-            player_points.append(points[i])
-            #Player form before the round
-            player_form.append(form[i-1])
-
-            #The team the player played for
-            team = ut.get_team_from_id(teams,team_id[i])            
-            #The index of the match in question in the team history df
-            j = team.history.index[team.history['match_id']==fixtures[i]].tolist()[0]
-            #The team elo before the match
-            de = team.history["elo_before_match"].values[j]
-
-            #Opponent team
-            opponent = ut.get_team_from_id(teams,opponent_id[i])
-            j = opponent.history.index[opponent.history['match_id']==fixtures[i]].tolist()[0]
-            #Opponent form and elo before the match
-            opponent_form.append(opponent.history["form"].values[j-1])
-            de -= opponent.history["elo_before_match"].values[j]
-            team_delta_elo.append(de)
+    return LinearModelFit(
+        model=PlayerPointPredictor(*coeffs),
+        coefficients={k:float(c) for k,c in zip(names,coeffs)},
+        fitted=fitted,
+        rms=float(np.sqrt(np.mean((fitted-y)**2))),
+        form_rms=float(np.sqrt(np.mean((X[:,0]-y)**2))),
+        r_squared=r_squared,
+        n_observations=len(y),
+        summary=summary,
+    )
 
-    #Y is the actual outcome
-    Y = np.array(player_points).reshape(-1, 1) 
+def fit_player_point_models(players:list[Player], teams:list[Team], season:Season = None, method:str = "statsmodels", verbose:bool = False) -> tuple[LinearModelFit,LinearModelFit]:
 
-    #We use the player form, opponent team form, and team elo difference to predict the player points
-    predictors = []
-    predictors.append(player_form)
-    predictors.append(opponent_form)
-    predictors.append(team_delta_elo)
-    X = np.array(predictors).T
-
-    #Add constant intercept
-    X2 = sm.add_constant(X)
-    #Fit linear regression model
-    est = sm.OLS(Y, X2)
-    est2 = est.fit()
-    #Predict given the input 
-    Y_pred = est2.predict(X2)
-
-    #Print model summary and rms values
-    print(est2.summary())
-    rms = np.sqrt(np.mean((Y_pred-Y)**2))
-    simple_rms1 = np.sqrt(np.mean((np.array(player_form).reshape(-1, 1)-Y)**2))
-    print(rms, simple_rms1)
-
-    coeffs = est2.params
-    model = PlayerPointPredictor(coeffs[0],coeffs[1],coeffs[2],coeffs[3])
-
-    from prettyplotting import PrettyPlot as pp
-    plot = pp.Plot(title="player form")
-    plot.scatter(player_form,Y,col="k")
-    plot.scatter(player_form,Y_pred,col="r")
-    plot.show()
-
-    plot = pp.Plot(title="opponent form")
-    plot.scatter(opponent_form,Y,col="k")
-    plot.scatter(opponent_form,Y_pred,col="r")
-    plot.show()  
-
-    plot = pp.Plot(title="team elo")
-    plot.scatter(team_delta_elo,Y,col="k")
-    plot.scatter(team_delta_elo,Y_pred,col="r")
-    plot.show()   
-
-
-    predictors = [player_form]
-    X = np.array(predictors).T
-
-    #Add constant intercept
-    X2 = sm.add_constant(X)
-    #Fit linear regression model
-    est = sm.OLS(Y, X2)
-    est2 = est.fit()
-    #Predict given the input 
-    Y_pred = est2.predict(X2)
-
-    #Print model summary and rms values
-    print(est2.summary())
-    rms = np.sqrt(np.mean((Y_pred-Y)**2))
-    simple_rms1 = np.sqrt(np.mean((np.array(player_form).reshape(-1, 1)-Y)**2))
-    print(rms, simple_rms1)
-
-    coeffs = est2.params
-    simple_model = PlayerPointPredictor(coeffs[0],coeffs[1])
-
-    plot = pp.Plot(title="player form")
-    plot.scatter(player_form,Y,col="k")
-    plot.scatter(player_form,Y_pred,col="r")
-    plot.show()
-
-    return model,simple_model
-
-def predict_player_points(players:list[Player], teams:list[Team], matches:list[Match], model:PlayerPointPredictor, simple_model:PlayerPointPredictor) -> None:
+    #Headless fit of the model and the simple model (player form only), nothing is plotted or printed
+    #unless verbose is set
+    X,Y = linear_model_features(players,teams,season,verbose)
+    return fit_linear_model(X,Y,method),fit_linear_model(X[:,:1],Y,method)
+
+def plot_linear_model_fit(fit:LinearModelFit, X:np.ndarray, Y:np.ndarray) -> None:
+
+    #prettyplotting is only needed to look at the fits
+    try:
+        from prettyplotting import PrettyPlot as pp
+    except ImportError:
+        print("prettyplotting is not installed, the fit is not plotted")
+        return
+
+    for title,x in zip(["player form","opponent form","team elo"],X.T):
+        plot = pp.Plot(title=title)
+        plot.scatter(x,Y,col="k")
+        plot.scatter(x,fit.fitted,col="r")
+        plot.show()
+
+def estimate_linear_model(players:list[Player], teams:list[Team], season:Season = None, method:str = "statsmodels", plot:bool = True, verbose:bool = True) -> tuple[PlayerPointPredictor,PlayerPointPredictor]:
+
+    X,Y = linear_model_features(players,teams,season,verbose)
+
+    models = []
+    for x in [X,X[:,:1]]:
+        fit = fit_linear_model(x,Y,method)
+
+        #Print model summary and rms values
+        if verbose:
+            print(fit.summary)
+            print(fit.rms, fit.form_rms)
+
+        if plot:
+            plot_linear_model_fit(fit,x,Y)
+
+        models.append(fit.model)
+
+    return models[0],models[1]
+
+def predict_player_points(players:list[Player], teams:list[Team], matches:list[Match], model:PlayerPointPredictor, simple_model:PlayerPointPredictor, season:Season = None) -> None:
+
+    if season is None:
+        season = Season(players,teams,matches)
     
     next_round = ut.get_next_round(matches)
     last_round = matches[-1].round
+    n_rounds = last_round-next_round+1
 
+    #Players with few points get their form, unavailable players zero and the rest are scored below
+    scored = []
     for p in players:
         
         if np.mean(p.history["total_points"].values[-4:]) < 2.0:
-            p.predicted_points = [p.current_form] * (last_round-next_round+1)
+            p.predicted_points = [p.current_form] * n_rounds
             continue
         
         if p.chance_of_playing < 0.25:
-            p.predicted_points = [0.0] * (last_round-next_round+1)
+            p.predicted_points = [0.0] * n_rounds
             continue
 
-        team = ut.get_team_from_id(teams, p.current_team_id)
-        round_score = []
+        scored.append(p)
+
+    if len(scored) == 0:
+        return
+
+    #Every (player, match) pair of the remaining rounds, from the fixture index of the player's team
+    team_ids,rounds,opponent_ids = season.fixture_index(next_round,last_round)
+    scored_team_ids = np.array([season.get_team(p.current_team_id).id for p in scored], dtype=np.int64)
+    team_starts = np.searchsorted(team_ids,scored_team_ids,side="left")
+    team_stops = np.searchsorted(team_ids,scored_team_ids,side="right")
+    n_matches = team_stops - team_starts
+
+    player_index = np.repeat(np.arange(len(scored)),n_matches)
+    entries = np.arange(n_matches.sum()) - np.repeat(np.cumsum(n_matches)-n_matches,n_matches) + np.repeat(team_starts,n_matches)
 
-        for r in range(next_round,last_round+1):
-            round_matches = [m for m in matches if m.round == r and team.id in [m.home_team_id,m.away_team_id]]
+    elo = {t.id:t.current_elo for t in season.teams}
+    form = {t.id:t.current_form for t in season.teams}
+    team_elo = np.array([elo[i] for i in team_ids])
+    opponent_elo = np.array([elo[i] for i in opponent_ids])
+    opponent_form = np.array([form[i] for i in opponent_ids])
 
-            pred_score = 0.0
+    player_form = np.array([p.current_form for p in scored], dtype=np.float64)[player_index]
+    chance_of_playing = np.array([p.chance_of_playing for p in scored], dtype=np.float64)[player_index]
+    n_history = np.array([len(p.history) for p in scored])[player_index]
 
-            for m in round_matches:
-                    
-                if team.id == m.home_team_id:
-                    opponent = ut.get_team_from_id(teams, m.away_team_id)
-                else:
-                    opponent = ut.get_team_from_id(teams, m.home_team_id)
-                
-                if len(p.history) == 1:
-                    pred_score += p.chance_of_playing * simple_model.predict(p,team,opponent) * 0.5
-                elif len(p.history) < 3:
-                    pred_score += p.chance_of_playing * simple_model.predict(p,team,opponent)    
-                else:
-                    pred_score += p.chance_of_playing * model.predict(p,team,opponent)    
+    #Players with a short history use the simple model, with only one match at half weight
+    simple_scores = chance_of_playing * simple_model.predict_many(player_form,team_elo[entries],opponent_form[entries],opponent_elo[entries])
+    scores = np.where(n_history < 3, simple_scores, chance_of_playing * model.predict_many(player_form,team_elo[entries],opponent_form[entries],opponent_elo[entries]))
+    scores = np.where(n_history == 1, simple_scores * 0.5, scores)
 
-            round_score.append(pred_score)            
+    #Matches of a double round are added in match order
+    round_score = np.zeros((len(scored),n_rounds))
+    np.add.at(round_score,(player_index,rounds[entries]-next_round),scores)
 
-        p.predicted_points = round_score
\ No newline at end of file
+    for p,s in zip(scored,round_score):
+        p.predicted_points = s.tolist()
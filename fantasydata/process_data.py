@@ -1,30 +1,60 @@
-from math import floor
-from fantasydata.classes import Player, Match, Squad, Team
+from fantasydata.classes import Player, Match, Squad, Team, Season, SquadOwnership
+from fantasydata.store import HistoryStore
+from fantasydata.elo import EloEngine
 import fantasydata.utility as ut
-import fantasydata.get_data as gd
 import pandas as pd
 import numpy as np
-import sys
 
-def calc_expected_elo_score(elo:float, opponent_elo:float) -> float:
-    return 1.0/(1.0+10**((opponent_elo-elo)/400.0))
+#Decay of the exponentially weighted form, the weight of a score is multiplied by this for every newer score
+FORM_COEFF = 0.60
 
-def calc_team_elo_update(start_elo:float, opponent_elo:float, score:float) -> float:
-
-    expected_score = calc_expected_elo_score(start_elo,opponent_elo)
-    K = 30.0
-    return start_elo + K*(score - expected_score)
+class DataQualityError(ValueError):
+    #Raised when the downloaded data is inconsistent, e.g. a player history refers to a match that is missing
+    pass
 
 def calc_norm_form(past_scores:list[float]) -> float:
 
     N = len(past_scores)
     form = 0.0
-    coeff = 0.60 
+    coeff = FORM_COEFF
     for i,score in enumerate(past_scores[::-1]):
         form += score * (1.0-coeff) * coeff**i
     return form/(1-coeff**N)
 
-def add_previous_team_to_player(p:Player, matches:list[Match]) -> None:
+def ewma_sums(scores:np.ndarray, positions:np.ndarray, coeff:float = FORM_COEFF, initial:np.ndarray = None) -> np.ndarray:
+
+    #The unnormalised sums S_i = coeff*S_(i-1) + (1-coeff)*x_i for many segments of histories at once.
+    #The rows of a segment are consecutive, positions is the position of each row within its segment
+    #and initial is the sum before the first row of the segment (zero if not given)
+    scores = np.asarray(scores, dtype=np.float64)
+    positions = np.asarray(positions, dtype=np.int64)
+
+    s = (1.0-coeff)*scores
+    if len(s) == 0:
+        return s
+
+    if initial is not None:
+        first = positions == 0
+        s[first] += coeff*np.asarray(initial, dtype=np.float64)[first]
+
+    #One step of the recursion per position, each step updates that row of every segment
+    order = np.argsort(positions, kind="stable")
+    counts = np.bincount(positions)
+    stops = np.cumsum(counts)
+    for start,stop in zip(stops[:-1],stops[1:]):
+        rows = order[start:stop]
+        s[rows] += coeff*s[rows-1]
+
+    return s
+
+def ewma_form(scores:np.ndarray, positions:np.ndarray, coeff:float = FORM_COEFF) -> np.ndarray:
+
+    #The normalised form after every score, for many histories at once, positions is the position of
+    #each row within its history. Recursive version of calc_norm_form: form_i = S_i/(1-coeff^(i+1))
+    positions = np.asarray(positions, dtype=np.int64)
+    return ewma_sums(scores,positions,coeff)/(1.0-coeff**(positions+1))
+
+def add_previous_team_to_player(p:Player, matches:list[Match], season:Season = None) -> None:
     
     #The previous match ids that the player participated in
     matches_played = p.history["fixture"].values
@@ -38,10 +68,13 @@ def add_previous_team_to_player(p:Player, matches:list[Match]) -> None:
         p.history["team_id"] = [p.current_team_id]
         return
 
+    if season is None:
+        season = Season([],[],matches)
+
     opponents = p.history["opponent_team"].values
     prev_teams = []
     for m_id,opp_id in zip(matches_played,opponents):
-        m = ut.get_match_from_id(matches,m_id)
+        m = season.get_match(m_id)
         
         if m.home_team_id == opp_id:
             team_id = m.away_team_id
@@ -54,7 +87,7 @@ def add_previous_team_to_player(p:Player, matches:list[Match]) -> None:
 
     p.history["team_id"] = prev_teams
 
-def add_rounds_to_player(p:Player, matches:list[Match]) -> None:
+def add_rounds_to_player(p:Player, matches:list[Match], season:Season = None) -> None:
     
     #The previous match ids that the player participated in
     matches_played = p.history["fixture"].values
@@ -63,236 +96,399 @@ def add_rounds_to_player(p:Player, matches:list[Match]) -> None:
         p.history["round"] = [np.nan]*len(p.history)
         return
 
+    if season is None:
+        season = Season([],[],matches)
+
     rounds = []
     for m_id in matches_played:
-        m = ut.get_match_from_id(matches,m_id)
+        m = season.get_match(m_id)
         rounds.append(m.round)
 
     p.history["round"] = rounds
    
-def add_result_and_form_to_team(teams:list[Team], matches:list[Match]) -> None:
+def player_history_store(players:list[Player], season:Season = None) -> HistoryStore:
 
-    for t in teams:
+    #The table of all player histories is built once and kept in the season for the later stages
+    if season is not None and season.player_history is not None:
+        return season.player_history
+
+    #The players take their history from the store, so the columns added by the stages are seen by them
+    with_history = [p for p in players if ut.has_history(p)]
+    store = HistoryStore.from_entities(with_history,"player_id")
+    store.attach(with_history)
+
+    if season is not None:
+        season.player_history = store
+
+    return store
+
+def team_and_round_from_fixtures(fixtures:np.ndarray, opponents:np.ndarray, player_ids:np.ndarray, single:np.ndarray, current_team_ids:np.ndarray, season:Season) -> tuple[np.ndarray,np.ndarray]:
+
+    #Team and round of history rows, found by joining the fixtures with the match table of the season.
+    #Rows with a missing fixture get missing values, rows of players with a single match get the current team
+    fixtures = np.asarray(fixtures, dtype=np.float64)
+    opponents = np.asarray(opponents, dtype=np.float64)
+    missing_rows = np.isnan(fixtures)
+
+    match_index = pd.Index(season.match_ids).get_indexer(np.where(missing_rows,-1,fixtures).astype(np.int64))
+    not_found = (match_index < 0) & ~missing_rows
+    if not_found.any():
+        raise ValueError(f"Match with id {int(fixtures[not_found][0])} not found in season")
+
+    home = season.match_home_team_ids[match_index]
+    away = season.match_away_team_ids[match_index]
+    rounds = season.match_rounds[match_index]
 
-        team_matches = [m for m in matches if t.id in [m.home_team_id,m.away_team_id] and m.finished]
+    team_ids = np.where(home == opponents, away, home).astype(np.float64)
+    unknown = (home != opponents) & (away != opponents) & ~missing_rows
+    if unknown.any():
+        i = np.flatnonzero(unknown)[0]
+        raise RuntimeError(f"Unable to find team for player {int(player_ids[i])} in match {season.get_match(int(fixtures[i]))}")
 
-        rounds = [m.round for m in team_matches]
-        match_id = [m.id for m in team_matches]
-        results = []
-        form = []
-        for m in team_matches:
+    team_ids[single] = np.asarray(current_team_ids, dtype=np.float64)[single]
 
-            r = 0.5
-            if m.home_goals > m.away_goals:
-                if t.id == m.home_team_id:
-                    r = 1.0
-                else:
-                    r = 0.0
-            elif m.home_goals < m.away_goals:
-                if t.id == m.home_team_id:
-                    r = 0.0
-                else:
-                    r = 1.0
+    team_ids[missing_rows] = np.nan
+    rounds[missing_rows] = np.nan
 
-            results.append(r)     
+    return team_ids,rounds
 
-            f = calc_norm_form(results)
-            form.append(f)
+def add_team_and_round_to_players(players:list[Player], matches:list[Match], season:Season = None) -> None:
 
+    #Same result as add_previous_team_to_player and add_rounds_to_player, with one join of all
+    #player histories against the match table
+    if season is None:
+        season = Season(players,[],matches)
+
+    store = player_history_store(players,season)
+
+    fixtures = store.column("fixture").astype(np.float64)
+    group = store.group_index
+    n_rows = np.bincount(group, minlength=len(store.ids))
+
+    #A history with a missing fixture gets missing teams and rounds
+    missing = np.bincount(group, weights=np.isnan(fixtures), minlength=len(store.ids)) > 0
+    fixtures[missing[group]] = np.nan
+
+    current_team_ids = np.array([season.get_player(int(i)).current_team_id for i in store.ids], dtype=np.float64)
+    team_ids,rounds = team_and_round_from_fixtures(fixtures,store.column("opponent_team"),store.ids[group],(n_rows == 1)[group],current_team_ids[group],season)
+
+    store.set_columns({
+        "team_id": team_ids if np.isnan(team_ids).any() else team_ids.astype(np.int64),
+        "round": rounds if np.isnan(rounds).any() else rounds.astype(np.int64),
+    })
+
+    for p in players:
+        if p.id not in store and p.history is not None:
+            add_previous_team_to_player(p,matches,season)
+            add_rounds_to_player(p,matches,season)
+
+def add_result_and_form_to_team(teams:list[Team], matches:list[Match], season:Season = None) -> None:
+
+    if season is None:
+        season = Season([],teams,matches)
+
+    finished = [m for m in matches if m.finished]
+
+    home_goals = np.array([m.home_goals for m in finished], dtype=np.float64)
+    away_goals = np.array([m.away_goals for m in finished], dtype=np.float64)
+    home_results = np.where(home_goals > away_goals, 1.0, np.where(home_goals < away_goals, 0.0, 0.5))
+
+    #Two rows per finished match, first the home team and then the away team, in the order of the match list
+    team_ids = np.column_stack([[m.home_team_id for m in finished],[m.away_team_id for m in finished]]).ravel().astype(np.int64)
+    match_ids = np.repeat([m.id for m in finished], 2)
+    rounds = np.repeat([m.round for m in finished], 2)
+    results = np.column_stack([home_results,1.0-home_results]).ravel()
+
+    for team_id in np.unique(team_ids):
+        season.get_team(int(team_id))
+
+    #Grouping the rows by team keeps the chronological order within each team
+    order = np.argsort(team_ids, kind="stable")
+    sorted_ids = team_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]]) if len(order) > 0 else np.zeros(0, dtype=np.int64)
+    stops = np.r_[starts[1:], len(order)].astype(np.int64)
+    positions = np.arange(len(order)) - np.repeat(starts, stops - starts)
+
+    form = ewma_form(results[order], positions)
+
+    #The form before each match, 0.5 before the first match of a team
+    previous_form = np.empty(len(order))
+    previous_form[order] = np.where(positions > 0, np.r_[np.nan, form[:-1]], 0.5)
+
+    offsets = {int(sorted_ids[start]):(start,stop) for start,stop in zip(starts,stops)}
+    last_form = {}
+    for t in teams:
         
+        start,stop = offsets.get(t.id,(0,0))
+        rows = order[start:stop]
+
         if t.history is None:
             t.history = pd.DataFrame()
         
-        t.history["rounds"] = rounds
-        t.history["match_id"] = match_id
-        t.history["results"] = results
-        t.history["form"] = form
+        t.history["rounds"] = rounds[rows]
+        t.history["match_id"] = match_ids[rows]
+        t.history["results"] = results[rows]
+        t.history["form"] = form[start:stop]
+        t.invalidate_cache()
+
+        if stop > start:
+            last_form[t.id] = form[stop-1]
 
     next_round = ut.get_next_round(matches)
-    
+
+    for m,home_previous,away_previous in zip(finished,previous_form[0::2],previous_form[1::2]):
+        if m.round != next_round:
+            m.delta_form = home_previous - away_previous
+
+    #Matches of the next round use the latest form of each team
     for m in matches:
-        
-        if not m.finished and m.round != next_round:
-            continue
 
-        home = ut.get_team_from_id(teams,m.home_team_id)
-        away = ut.get_team_from_id(teams,m.away_team_id)
+        if m.round != next_round:
+            continue
 
-        home_form = home.history["form"].values
-        away_form = away.history["form"].values
+        home = season.get_team(m.home_team_id)
+        away = season.get_team(m.away_team_id)
 
-        if len(home_form) == 0 or len(away_form) == 0:
+        if home.id not in last_form or away.id not in last_form:
             m.delta_form = 0.0
-            continue
+        else:
+            m.delta_form = last_form[home.id] - last_form[away.id]
 
-        if m.round == next_round:
-            m.delta_form = home_form[-1] - away_form[-1]
-            continue
+def add_sum_points_to_team(t:Team, players:list[Player]) -> None:
+    add_sum_points_to_teams([t],players)
+
+def add_sum_points_to_teams(teams:list[Team], players:list[Player], season:Season = None) -> None:
+
+    #The points and number of players of every (team, match) are summed with one grouping of all player rows
+    store = player_history_store(players,season)
+
+    rows = pd.DataFrame({
+        "team_id": store.column("team_id"),
+        "match_id": store.column("fixture"),
+        "team_points": store.column("total_points"),
+        "n_players": store.column("minutes") > 0,
+    })
+    rows = rows[rows["team_id"].isin([t.id for t in teams])]
+    sums = rows.groupby(["team_id","match_id"]).sum()
+
+    keys = pd.MultiIndex.from_arrays([
+        np.concatenate([np.full(len(t.history),t.id) for t in teams]),
+        np.concatenate([t.history["match_id"].values for t in teams]),
+    ])
+
+    missing = sums.index.difference(keys)
+    if len(missing) > 0:
+        team_id,match_id = missing[0]
+        raise DataQualityError(f"{len(missing)} (team, match) pairs of the player histories are not in the team histories, first is team {int(team_id)} in match {int(match_id)}")
+
+    sums = sums.reindex(keys, fill_value=0)
+    start = 0
+    for t in teams:
+        stop = start + len(t.history)
+        t.history["team_points"] = sums["team_points"].values[start:stop].astype(np.int64)
+        t.history["n_players"] = sums["n_players"].values[start:stop].astype(np.int64)
+        start = stop
 
-        found_match = False
-        for i,hf in enumerate(home_form):
-            if home.history["match_id"].values[i] == m.id:
-                if i == 0:
-                    m.delta_form = 0.5
-                else:
-                    m.delta_form = home_form[i-1]
+def add_team_elo(teams:list[Team], matches:list[Match], initial_elo:pd.DataFrame, season:Season = None, engine:EloEngine = None) -> EloEngine:
 
-                found_match = True
-                break
+    #A resumed engine only applies the matches finished since its state was saved
+    if engine is None:
+        engine = EloEngine()
 
-        if not found_match:
-            print("Did not find match for home team:",m)
-            m.delta_form = 0.5
+    engine.set_initial_ratings(teams,initial_elo)
+    for t in teams:
+        t.initial_elo = engine.initial_ratings[t.id]
 
-        found_match = False
-        for i,af in enumerate(away_form):
-            if away.history["match_id"].values[i] == m.id:
-                if i == 0:
-                    m.delta_form -= 0.5
-                else:
-                    m.delta_form -= away_form[i-1]  
+    #Finished matches of the next round are not used to update the ratings
+    next_round = ut.get_next_round(matches)
+    next_matches = [m for m in matches if m.round == next_round]
+    engine.apply_all([m for m in matches if m.round != next_round])
+    engine.predict(next_matches)
 
-                found_match = True
-                break
+    #Expected result of both teams in the next round matches
+    predicted = {}
+    for m in next_matches:
+        predicted[(m.home_team_id,m.id)] = m.expected_home_score
+        predicted[(m.away_team_id,m.id)] = m.expected_away_score
 
-        if not found_match:
-            print("Did not find match for away team:",m,away)
-            m.delta_form -= 0.5            
+    for t in teams:
+        history = engine.team_history(t.id)
+        match_ids = t.history["match_id"].values
+        index = pd.Index(history["match_id"].values).get_indexer(match_ids)
+        applied = index >= 0
+
+        #The team tables also have the finished matches of the next round (played mid-week). They do not
+        #change the rating, so the elo before and after is the current rating and the result is the prediction
+        not_applied = [(t.id,int(i)) for i in match_ids[~applied]]
+        if any(k not in predicted for k in not_applied):
+            raise DataQualityError(f"Match {not_applied[0][1]} of team {t.name} has no elo rating")
+        elo = engine.rating(t.id)
+        expected = np.array([predicted[k] for k in not_applied], dtype=np.float64)
+
+        for column,values in [("elo_before_match",np.full(len(expected),elo)),("elo_after_match",np.full(len(expected),elo)),("expected_result",expected)]:
+            column_values = np.empty(len(match_ids))
+            column_values[applied] = history[column].values[index[applied]]
+            column_values[~applied] = values
+            t.history[column] = column_values
+        t.invalidate_cache()
+
+    return engine
 
-def add_sum_points_to_team(t:Team, players:list[Player]) -> None:
+def add_player_form(p:Player) -> None:
+    p.history["form"] = ewma_form(p.history["total_points"].values,np.arange(len(p.history)))
+    p.invalidate_cache()
 
-    participating_players = [p for p in players if t.id in p.history["team_id"].values]
+def add_players_form(players:list[Player], season:Season = None) -> None:
 
-    team_points = [0]*len(t.history)
-    n_players = [0]*len(t.history)
+    #The form of every player is computed in one pass over a table of all player histories
+    store = player_history_store(players,season)
+    store.set_column("form",ewma_form(store.column("total_points"),store.positions))
 
-    for p in participating_players:
-        
-        for points,minutes,team_id,match_id in zip(p.history["total_points"],p.history["minutes"],p.history["team_id"],p.history["fixture"]):
-            if team_id == t.id:
-                try:
-                    i = list(t.history["match_id"].values).index(match_id)
-                except ValueError:
-                    print(t,match_id,p)
-                    print(t.history)
-                    print(p.history)
-                    sys.exit()
-                team_points[i] += points
-                if minutes > 0:
-                    n_players[i] += 1
-    
-    t.history["team_points"] = team_points
-    t.history["n_players"] = n_players
+    #Players read from file without matches have a single row of missing values
+    for p in players:
+        if p.id not in store and p.history is not None:
+            add_player_form(p)
 
-def add_team_elo(teams:list[Team], matches:list[Match], initial_elo:pd.DataFrame) -> None:
+#Season of a worker process, set once by the pool initializer so that the match table is not sent with every task
+_worker_season = None
 
-    elo = {}
-    expected_result = {}
-    for t in teams:
-        df = initial_elo[initial_elo["team_name"]==t.name]
-        elo[t.id] = [df["elo"].values[0]]
-        expected_result[t.id] = []
-        t.initial_elo = elo[t.id]        
+def _init_player_worker(matches:list[Match]) -> None:
+    global _worker_season
+    _worker_season = Season([],[],matches)
 
-    next_round = ut.get_next_round(matches)
-    
-    for m in matches:
-        
-        if not m.finished and m.round != next_round:
-            continue
+def _player_chunk_attributes(fixtures:np.ndarray, opponents:np.ndarray, scores:np.ndarray, positions:np.ndarray, player_ids:np.ndarray, single:np.ndarray, current_team_ids:np.ndarray) -> tuple[np.ndarray,np.ndarray,np.ndarray]:
+    team_ids,rounds = team_and_round_from_fixtures(fixtures,opponents,player_ids,single,current_team_ids,_worker_season)
+    return team_ids,rounds,ewma_form(scores,positions)
 
-        home_team = ut.get_team_from_id(teams, m.home_team_id)
-        away_team = ut.get_team_from_id(teams, m.away_team_id)
+def add_player_attributes_parallel(players:list[Player], matches:list[Match], season:Season = None, n_workers:int = None, chunk_size:int = 200) -> None:
 
-        prev_home_elo = elo[home_team.id][-1]
-        prev_away_elo = elo[away_team.id][-1]
+    #Same result as add_team_and_round_to_players and add_players_form, with the players split in chunks
+    #of whole histories that are processed by a pool of worker processes (n_workers=None uses every cpu).
+    #On platforms that start the workers with spawn (Windows and macOS) the calling script must create the
+    #pool under an if __name__ == "__main__": guard, otherwise every worker runs the script again.
+    #With n_workers <= 1, or fewer players than one chunk, the attributes are computed in this process
+    from concurrent.futures import ProcessPoolExecutor
 
-        home_expected_score = calc_expected_elo_score(prev_home_elo,prev_away_elo)
-        away_expected_score = 1.0 - home_expected_score
+    if season is None:
+        season = Season(players,[],matches)
 
-        m.expected_home_score = home_expected_score
-        m.expected_away_score = away_expected_score
-        m.delta_elo = prev_home_elo - prev_away_elo
+    store = player_history_store(players,season)
 
-        if m.round == next_round:
-            continue
+    if (n_workers is not None and n_workers <= 1) or len(store.ids) <= chunk_size:
+        add_team_and_round_to_players(players,matches,season)
+        add_players_form(players,season)
+        return
 
-        home_score = 0.5
+    fixtures = store.column("fixture").astype(np.float64)
+    group = store.group_index
+    n_players = len(store.ids)
 
-        if m.home_goals > m.away_goals:
-            home_score = 1.0
-        elif m.home_goals < m.away_goals:
-            home_score = 0.0
+    missing = np.bincount(group, weights=np.isnan(fixtures), minlength=n_players) > 0
+    fixtures[missing[group]] = np.nan
 
-        away_score = 1.0 - home_score
+    columns = [
+        fixtures,
+        store.column("opponent_team").astype(np.float64),
+        store.column("total_points").astype(np.float64),
+        store.positions,
+        store.ids[group],
+        (np.bincount(group, minlength=n_players) == 1)[group],
+        np.array([season.get_player(int(i)).current_team_id for i in store.ids], dtype=np.float64)[group],
+    ]
 
-        new_home_elo = calc_team_elo_update(prev_home_elo,prev_away_elo,home_score)
-        new_away_elo = calc_team_elo_update(prev_away_elo,prev_home_elo,away_score)
+    chunks = [(start,stop) for start,stop in zip(store.starts[::chunk_size],np.r_[store.starts[chunk_size::chunk_size],len(store)])]
 
-        elo[home_team.id].append(new_home_elo)
-        elo[away_team.id].append(new_away_elo)
-        expected_result[home_team.id].append(home_expected_score)
-        expected_result[away_team.id].append(away_expected_score)          
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_player_worker, initargs=(matches,)) as executor:
+        futures = [executor.submit(_player_chunk_attributes,*[c[start:stop] for c in columns]) for start,stop in chunks]
+        results = [f.result() for f in futures]
 
-    for t in teams:
-        n = len(elo[t.id])
-        t.history["elo_before_match"] = elo[t.id][:n-1]
-        t.history["elo_after_match"] = elo[t.id][1:]
-        t.history["expected_result"] = expected_result[t.id]
+    team_ids = np.concatenate([r[0] for r in results]) if len(results) > 0 else np.zeros(0)
+    rounds = np.concatenate([r[1] for r in results]) if len(results) > 0 else np.zeros(0)
+    form = np.concatenate([r[2] for r in results]) if len(results) > 0 else np.zeros(0)
 
-def add_player_form(p:Player) -> None:
-        form = []
-        for i in range(len(p.history)):
-            form.append(calc_norm_form(p.history["total_points"][:i+1]))
-        p.history["form"] = form
+    store.set_columns({
+        "team_id": team_ids if np.isnan(team_ids).any() else team_ids.astype(np.int64),
+        "round": rounds if np.isnan(rounds).any() else rounds.astype(np.int64),
+        "form": form,
+    })
 
-def add_squad_adjusted_player_value(players:list[Player], squad:Squad) -> None:
+    for p in players:
+        if p.id not in store and p.history is not None:
+            add_previous_team_to_player(p,matches,season)
+            add_rounds_to_player(p,matches,season)
+            add_player_form(p)
+
+def add_squad_adjusted_player_value(players:list[Player], squad:Squad, season:Season = None, ownership:SquadOwnership = None) -> None:
+
+    #A kept ownership index is only updated with the gameweeks added since the last call
+    if ownership is None:
+        ownership = SquadOwnership()
+    ownership.update(squad)
+
+    players_by_id = {p.id:p for p in players}
+    player_ids,acquired = ownership.owned(squad.id)
+    is_known = np.array([i in players_by_id for i in player_ids], dtype=bool)
+    player_ids,acquired = player_ids[is_known],acquired[is_known]
+
+    store = player_history_store(players,season)
+    group = store.group_index
+
+    #Row of the first match of every (player, round)
+    rows = pd.DataFrame({"player_id": store.ids[group], "round": store.column("round").astype(np.float64)})
+    rows = rows.drop_duplicates(keep="first")
+    first_rows = pd.MultiIndex.from_arrays([rows["player_id"].values,rows["round"].values])
+
+    #The value of the player in the round he was bought, or in the round before if he did not play then
+    found = first_rows.get_indexer(pd.MultiIndex.from_arrays([player_ids,acquired]))
+    before = first_rows.get_indexer(pd.MultiIndex.from_arrays([player_ids,acquired-1.0]))
+    found = np.where(found >= 0, found, before)
+    i = np.where(found >= 0, rows.index.values[found], -1)
+
+    #Players that have always been in the squad use the first recorded value as buy cost
+    always = np.isnan(acquired)
+    in_store = np.array([p in store for p in player_ids], dtype=bool)
+    i[always & in_store] = store.starts[np.searchsorted(store.ids,player_ids[always & in_store])]
+    i[~in_store] = -1
+
+    values = store.column("value").astype(np.float64)
+    current_values = np.array([players_by_id[p].current_value for p in player_ids], dtype=np.float64)
+
+    #The sale value is the average of the buy value and current value, rounded down
+    sale_values = np.floor(0.5*(values[i] + current_values))
+
+    missing = []
+    for p,sale_value,row,a in zip(player_ids,sale_values,i,always):
+        if row < 0:
+            missing.append(players_by_id[p])
+            continue
+        if a:
+            print(f"Player {players_by_id[p]} has always been in the squad, using first recorded value as buy cost")
+        players_by_id[p].squad_adjusted_value = int(sale_value)
 
-    current_players = [p for p in players if p.id in squad.current_players]
+    if len(missing) > 0:
+        raise DataQualityError(f"Unable to find the buy value of {len(missing)} players of squad {squad.id}, first is {missing[0]}")
 
-    for p in current_players:
-        
-        set_value = False
-
-        for r,player_ids in zip(squad.history["round"].values[::-1][1:],squad.history["player_ids"].values[::-1][1:]):
-            
-            if p.id not in player_ids:
-                
-                #Try to use the value of the player in the round he was first present
-                try:
-                    i = list(p.history["round"].values).index(r+1)
-                except ValueError:
-                    #If the round does not exist, try to use the previous round
-                    try:
-                        i = list(p.history["round"].values).index(r)   
-                    except ValueError:
-                        print(f"Unable to find round for player {p}:",r,p.history["round"],p.history["value"])
-                        sys.exit()
-
-                #The sale value is the average of the buy value and current value, rounded down
-                sale_value = floor(0.5*(p.history['value'].values[i] + p.current_value))
-                p.squad_adjusted_value = sale_value
-                set_value = True
-                break
-        
-        if not set_value:
-            print(f"Player {p} has always been in the squad, using first recorded value as buy cost")
-            
-            sale_value = floor(0.5*(p.history['value'].values[0] + p.current_value))
-            p.squad_adjusted_value = sale_value
+def add_calculated_attributes(players:list[Player], teams:list[Team], matches:list[Match], squad:Squad, initial_elo:pd.DataFrame, season:Season = None, elo_engine:EloEngine = None, n_workers:int = 1, chunk_size:int = 200, ownership:SquadOwnership = None) -> None:
 
+    if season is None:
+        season = Season(players,teams,matches)
 
-def add_calculated_attributes(players:list[Player], teams:list[Team], matches:list[Match], squad:Squad, initial_elo:pd.DataFrame) -> None:
+    #The store is built from the current player histories for this call only, a store kept from an earlier
+    #call would bring back histories that have been changed or replaced since
+    season.player_history = None
    
-    for p in players:
-        add_previous_team_to_player(p,matches)
-        add_rounds_to_player(p,matches)
-        add_player_form(p)
+    if n_workers == 1:
+        add_team_and_round_to_players(players,matches,season)
+        add_players_form(players,season)
+    else:
+        add_player_attributes_parallel(players,matches,season,n_workers,chunk_size)
 
-    add_result_and_form_to_team(teams,matches)
-    add_team_elo(teams,matches,initial_elo)
+    add_result_and_form_to_team(teams,matches,season)
+    add_team_elo(teams,matches,initial_elo,season,elo_engine)
 
-    for t in teams:
-        add_sum_points_to_team(t,players)
+    add_sum_points_to_teams(teams,players,season)
+
+    #A kept ownership index (see SquadOwnership) is only updated with the gameweeks added since the last call
+    add_squad_adjusted_player_value(players,squad,season,ownership)
 
-    add_squad_adjusted_player_value(players,squad)
\ No newline at end of file
+    season.player_history = None
\ No newline at end of file
@@ -0,0 +1,155 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from email.utils import formatdate
+from urllib.parse import urlparse
+import argparse
+import hashlib
+import os
+import random
+import threading
+import time
+
+def recording_path(directory:str, url:str) -> str:
+
+    #The recordings mirror the url paths, e.g. api/element-summary/1/index.json
+    parts = [p for p in urlparse(url).path.split("/") if p not in ["",".",".."]]
+    return os.path.join(directory, *parts, "index.json")
+
+def record_response(directory:str, url:str, content:bytes) -> None:
+
+    path = recording_path(directory,url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    #Write to a temporary file first so that a replay never sees a partial recording
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path,"wb") as f:
+        f.write(content)
+    os.replace(tmp_path,path)
+
+class ReplayHandler(BaseHTTPRequestHandler):
+
+    server:"ReplayServer"
+
+    def do_GET(self) -> None:
+
+        server = self.server
+        server.count_request()
+
+        delay = server.latency + random.uniform(0.0,server.latency_jitter)
+        if delay > 0.0:
+            time.sleep(delay)
+
+        if random.random() < server.error_rate:
+            server.count_error()
+            self.send_error(server.error_status)
+            return
+
+        path = recording_path(server.directory,self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+
+        with open(path,"rb") as f:
+            content = f.read()
+
+        etag = '"' + hashlib.sha256(content).hexdigest()[:32] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag",etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type","application/json")
+        self.send_header("Content-Length",str(len(content)))
+        self.send_header("ETag",etag)
+        self.send_header("Last-Modified",formatdate(os.path.getmtime(path),usegmt=True))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format:str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format,*args)
+
+class ReplayServer(ThreadingHTTPServer):
+
+    directory:str
+    latency:float
+    latency_jitter:float
+    error_rate:float
+    error_status:int
+    verbose:bool
+    n_requests:int
+    n_errors:int
+
+    daemon_threads = True
+
+    def __init__(self, directory:str, host:str = "localhost", port:int = 0, latency:float = 0.0, latency_jitter:float = 0.0, error_rate:float = 0.0, error_status:int = 503, verbose:bool = False) -> None:
+        if not os.path.isdir(directory):
+            raise ValueError(f"Recording directory does not exist: {directory}")
+        if not 0.0 <= error_rate <= 1.0:
+            raise ValueError(f"Error rate must be between 0 and 1: {error_rate}")
+
+        super().__init__((host,port),ReplayHandler)
+
+        self.directory = directory
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.verbose = verbose
+        self.n_requests = 0
+        self.n_errors = 0
+        self._count_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host,port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def count_request(self) -> None:
+        with self._count_lock:
+            self.n_requests += 1
+
+    def count_error(self) -> None:
+        with self._count_lock:
+            self.n_errors += 1
+
+    def start(self) -> "ReplayServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "ReplayServer":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def __str__(self) -> str:
+        return f"Replay server at {self.url} for {self.directory}, {self.n_requests} requests, {self.n_errors} injected errors\n"
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Serve recorded FPL API responses")
+    parser.add_argument("directory")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--latency-jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+
+    server = ReplayServer(args.directory,args.host,args.port,args.latency,args.latency_jitter,args.error_rate,args.error_status,verbose=True)
+    print(f"Serving {args.directory} at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,246 @@
+from typing import Any, Union
+from fantasydata.classes import Player, Team, Squad, Match
+from fantasydata.storage import StorageBackend, CsvBackend
+import fantasydata.utility as ut
+import pandas as pd
+import numpy as np
+import json
+import math
+import os
+
+#Floats are rounded before comparing snapshots
+FLOAT_DECIMALS = 10
+
+#Id column of each table, the history rows of an entity are keyed by (id, position in history)
+TABLE_IDS = {
+    "players": "player_id",
+    "teams": "team_id",
+    "matches": "id",
+    "squad": "squad_id",
+}
+
+def canonical_value(v:Any) -> str:
+
+    #Values that are equal before and after a round trip through a storage backend get the same text
+    if v is None:
+        return "nan"
+    if isinstance(v,(list,tuple,np.ndarray)):
+        return "[" + ",".join(canonical_value(x) for x in v) + "]"
+    if isinstance(v,(bool,np.bool_)):
+        return repr(float(v))
+    if isinstance(v,str):
+        if v.startswith("["):
+            try:
+                return canonical_value(json.loads(v))
+            except ValueError:
+                return v
+        try:
+            return canonical_value(float(v))
+        except ValueError:
+            return v
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return str(v)
+    if math.isnan(f):
+        return "nan"
+    return repr(round(f,FLOAT_DECIMALS))
+
+def canonical_datetimes(values:pd.Series) -> pd.Series:
+    #Times are compared as UTC text, they are read back from text files as strings
+    text = pd.to_datetime(values,utc=True).dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    return text.fillna("nan").astype(object)
+
+def canonical_column(values:pd.Series) -> pd.Series:
+
+    #Numeric columns (also numbers stored as text) are compared as rounded floats, the
+    #csv parser is not exact in the last digit
+    if isinstance(values.dtype,pd.DatetimeTZDtype) or pd.api.types.is_datetime64_dtype(values.dtype):
+        return canonical_datetimes(values)
+    if values.dtype == object or isinstance(values.dtype,pd.StringDtype):
+        numeric = pd.to_numeric(values,errors="coerce")
+        if numeric.notna().sum() != values.notna().sum():
+            times = pd.to_datetime(values,utc=True,errors="coerce",format="ISO8601")
+            if values.notna().any() and times.notna().sum() == values.notna().sum():
+                return canonical_datetimes(times)
+            return values.map(canonical_value).astype(object)
+        values = numeric
+    return pd.Series(np.round(values.to_numpy(dtype=np.float64,na_value=np.nan),FLOAT_DECIMALS),index=values.index)
+
+def row_hashes(df:pd.DataFrame, columns:list[str]) -> np.ndarray:
+
+    canonical = pd.DataFrame({c:(canonical_column(df[c]) if c in df.keys() else np.full(len(df),np.nan)) for c in columns},index=df.index)
+    return pd.util.hash_pandas_object(canonical,index=False).values
+
+def split_entities(objects:list[Union[Player,Team,Match,Squad]], id_column:str) -> tuple[pd.DataFrame,pd.DataFrame]:
+
+    #The attributes are stored once per entity and the history rows separately, so that a changed
+    #attribute (e.g. the current value of a player) does not change every history row
+    attributes = [o.attributes() for o in objects]
+    entity_df = pd.DataFrame(attributes)
+
+    frames = []
+    for o,a in zip(objects,attributes):
+        history = getattr(o,"history",None)
+        if history is None or len(history) == 0:
+            continue
+        history = history.drop(columns=[k for k in a.keys() if k in history.keys()])
+        history.insert(0,"_seq",np.arange(len(history)))
+        history.insert(0,id_column,o.id)
+        frames.append(history)
+
+    if len(frames) == 0:
+        history_df = pd.DataFrame(columns=[id_column,"_seq"])
+    else:
+        history_df = pd.concat(frames,ignore_index=True)
+
+    return entity_df,history_df
+
+def join_entities(entity_df:pd.DataFrame, history_df:pd.DataFrame, id_column:str) -> pd.DataFrame:
+
+    if len(history_df) == 0:
+        return entity_df
+
+    history_df = history_df.sort_values([id_column,"_seq"],kind="stable").drop(columns=["_seq"])
+    history_df = history_df.drop(columns=[c for c in entity_df.keys() if c in history_df.keys() and c != id_column])
+    df = entity_df.merge(history_df,on=id_column,how="left",sort=False)
+
+    return df
+
+class SnapshotStore:
+
+    directory:str
+    backend:StorageBackend
+    manifest:list[dict[str,Any]]
+
+    def __init__(self, directory:str, backend:StorageBackend = None) -> None:
+
+        if backend is None:
+            backend = CsvBackend()
+
+        self.directory = directory
+        self.backend = backend
+        self.manifest = []
+        self._latest = {}
+
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self._manifest_path()):
+            with open(self._manifest_path(),"r") as f:
+                self.manifest = json.load(f)
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory,"manifest.json")
+
+    @property
+    def gameweeks(self) -> list[int]:
+        return [entry["gameweek"] for entry in self.manifest]
+
+    def _name(self, gameweek:int, table:str, part:str) -> str:
+        return f"snapshot_{gameweek}_{table}_{part}"
+
+    def _read_part(self, gameweek:int, table:str, part:str) -> pd.DataFrame:
+        return self.backend.read(self.directory,self._name(gameweek,table,part))
+
+    def _write_part(self, df:pd.DataFrame, gameweek:int, table:str, part:str) -> None:
+        self.backend.write(df,self.directory,self._name(gameweek,table,part))
+
+    def _state(self, gameweek:int, table:str, part:str) -> pd.DataFrame:
+
+        #Apply the deltas of every snapshot up to and including the gameweek
+        id_column = TABLE_IDS[table]
+        key_columns = [id_column] if part == "entities" else [id_column,"_seq"]
+
+        state = None
+        for entry in self.manifest:
+            if entry["gameweek"] > gameweek:
+                break
+            counts = entry["tables"][table][part]
+
+            if state is not None and counts["deleted"] > 0:
+                deleted = self._read_part(entry["gameweek"],table,f"{part}_deleted")
+                state = state[~np.isin(row_hashes(state,key_columns),row_hashes(deleted,key_columns))]
+
+            if counts["changed"] > 0 or state is None:
+                delta = self._read_part(entry["gameweek"],table,part)
+                if state is None:
+                    state = delta
+                else:
+                    state = state[~np.isin(row_hashes(state,key_columns),row_hashes(delta,key_columns))]
+                    state = pd.concat([state,delta],ignore_index=True)
+
+        return state
+
+    def _latest_state(self, table:str, part:str) -> pd.DataFrame:
+
+        #The state of the last snapshot is kept after a write, so the deltas are only replayed once
+        if (table,part) not in self._latest:
+            self._latest[(table,part)] = self._state(self.manifest[-1]["gameweek"],table,part)
+        return self._latest[(table,part)]
+
+    def write(self, gameweek:int, players:list[Player], teams:list[Team], matches:list[Match], squad:Squad) -> None:
+
+        if len(self.manifest) > 0 and gameweek <= self.manifest[-1]["gameweek"]:
+            raise ValueError(f"Snapshots are append only, gameweek {gameweek} is not after the last snapshot {self.manifest[-1]['gameweek']}")
+
+        previous_gameweek = self.manifest[-1]["gameweek"] if len(self.manifest) > 0 else None
+        entry = {"gameweek": gameweek, "squad_id": squad.id, "tables": {}}
+        latest = {}
+
+        for table,objects in [("players",players),("teams",teams),("matches",matches),("squad",[squad])]:
+
+            id_column = TABLE_IDS[table]
+            entity_df,history_df = split_entities(objects,id_column)
+            entry["tables"][table] = {}
+
+            for part,df,key_columns in [("entities",entity_df,[id_column]),("history",history_df,[id_column,"_seq"])]:
+
+                if previous_gameweek is None:
+                    changed = df
+                    deleted = df.iloc[0:0][key_columns]
+                else:
+                    previous = self._latest_state(table,part)
+                    columns = sorted(set(df.keys()) | set(previous.keys()))
+
+                    keys = row_hashes(df,key_columns)
+                    previous_keys = row_hashes(previous,key_columns)
+
+                    #A row is written if its key is new or if any of its values changed
+                    previous_hashes = pd.Series(row_hashes(previous,columns),index=previous_keys)
+                    is_changed = ~np.isin(keys,previous_keys)
+                    is_changed[~is_changed] = previous_hashes.reindex(keys[~is_changed]).values != row_hashes(df,columns)[~is_changed]
+
+                    changed = df[is_changed]
+                    deleted = previous[~np.isin(previous_keys,keys)][key_columns]
+
+                self._write_part(changed,gameweek,table,part)
+                if len(deleted) > 0:
+                    self._write_part(deleted,gameweek,table,f"{part}_deleted")
+
+                entry["tables"][table][part] = {"rows": len(df), "changed": len(changed), "deleted": len(deleted)}
+                latest[(table,part)] = df
+
+        self.manifest.append(entry)
+        with open(self._manifest_path(),"w") as f:
+            json.dump(self.manifest,f,indent=1)
+        self._latest = latest
+
+    def read(self, gameweek:int) -> tuple[list[Player],list[Team],list[Match],Squad]:
+
+        if gameweek not in self.gameweeks:
+            raise ValueError(f"No snapshot for gameweek {gameweek}, available gameweeks: {self.gameweeks}")
+
+        frames = {}
+        for table,id_column in TABLE_IDS.items():
+            entity_df = self._state(gameweek,table,"entities")
+            history_df = self._state(gameweek,table,"history")
+            frames[table] = join_entities(entity_df,history_df,id_column)
+
+        players = ut.dataframe_to_players(frames["players"])
+        teams = ut.dataframe_to_teams(frames["teams"])
+        matches = ut.dataframe_to_matches(frames["matches"])
+        squad = ut.dataframe_to_squad(frames["squad"])
+
+        return players,teams,matches,squad
+
+    def disk_usage(self) -> int:
+        return sum(os.path.getsize(os.path.join(self.directory,f)) for f in os.listdir(self.directory))
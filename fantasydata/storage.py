@@ -0,0 +1,214 @@
+from abc import ABC, abstractmethod
+from typing import Union, TYPE_CHECKING
+from fantasydata.store import HISTORY_DTYPES
+import pandas as pd
+import numpy as np
+import sqlite3
+import importlib.util
+import json
+import os
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+#Columns that are always read as text from csv, the numeric columns are typed by store.HISTORY_DTYPES
+TEXT_DTYPES = {
+    "name": str,
+    "position": str,
+    "current_team_name": str,
+    "home_team_name": str,
+    "away_team_name": str,
+    "kickoff_time": str,
+    "start_time": str,
+    "current_player_ids": str,
+    "player_ids": str,
+}
+
+#Element types of the list attributes, stored as native list columns in parquet
+LIST_DTYPES = {
+    "predicted_points": np.float64,
+    "current_player_ids": np.int64,
+    "player_ids": np.int64,
+}
+
+class StorageBackend(ABC):
+
+    @abstractmethod
+    def write(self, df:pd.DataFrame, directory:str, name:str) -> None:
+        pass
+
+    @abstractmethod
+    def read(self, directory:str, name:str, columns:list[str] = None) -> pd.DataFrame:
+        pass
+
+    @abstractmethod
+    def exists(self, directory:str, name:str) -> bool:
+        pass
+
+class CsvBackend(StorageBackend):
+
+    def path(self, directory:str, name:str) -> str:
+        return f"{directory}{name}.csv"
+
+    def write(self, df:pd.DataFrame, directory:str, name:str) -> None:
+        df.to_csv(self.path(directory,name),sep=";",index=False)
+
+    def read(self, directory:str, name:str, columns:list[str] = None) -> pd.DataFrame:
+        #Lists are stored as text and every column is parsed, only the requested ones are kept
+        return pd.read_csv(self.path(directory,name),sep=";",dtype=TEXT_DTYPES,usecols=columns)
+
+    def exists(self, directory:str, name:str) -> bool:
+        return os.path.exists(self.path(directory,name))
+
+class ParquetBackend(StorageBackend):
+
+    compression:str
+    memory_map:bool
+
+    def __init__(self, compression:str = "snappy", memory_map:bool = True) -> None:
+        #pyarrow is an optional dependency, only needed for this backend
+        if importlib.util.find_spec("pyarrow") is None:
+            raise ImportError("The parquet storage backend requires pyarrow, install it with pip install pyarrow")
+
+        self.compression = compression
+        self.memory_map = memory_map
+
+    def path(self, directory:str, name:str) -> str:
+        return f"{directory}{name}.parquet"
+
+    def write(self, df:pd.DataFrame, directory:str, name:str) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(df, schema=parquet_schema(df), preserve_index=False)
+        pq.write_table(table, self.path(directory,name), compression=self.compression)
+
+    def read(self, directory:str, name:str, columns:list[str] = None) -> pd.DataFrame:
+        import pyarrow.parquet as pq
+
+        #Only the requested columns are read from the file
+        table = pq.read_table(self.path(directory,name), columns=columns, memory_map=self.memory_map)
+        return table.to_pandas()
+
+    def exists(self, directory:str, name:str) -> bool:
+        return os.path.exists(self.path(directory,name))
+
+def parquet_schema(df:pd.DataFrame) -> "pa.Schema":
+    import pyarrow as pa
+
+    #The known columns always get the same type, also when a file has only missing values in a column or
+    #floats in an int column with missing values. List attributes are written as native list columns
+    fields = []
+    for c in df.keys():
+        values = df[c]
+        if c in LIST_DTYPES:
+            dtype = pa.list_(pa.from_numpy_dtype(LIST_DTYPES[c]))
+        elif c in HISTORY_DTYPES and (pd.api.types.is_numeric_dtype(values.dtype) or values.isna().all()):
+            dtype = pa.from_numpy_dtype(HISTORY_DTYPES[c])
+        elif c in TEXT_DTYPES and (pd.api.types.is_string_dtype(values.dtype) or values.isna().all()):
+            dtype = pa.string()
+        else:
+            dtype = pa.Array.from_pandas(values).type
+        fields.append(pa.field(str(c), dtype))
+
+    return pa.schema(fields)
+
+#Columns that are indexed when a table is written to sqlite
+SQLITE_INDEX_COLUMNS = ["player_id","team_id","squad_id","id","match_id","round","rounds","fixture"]
+
+class SqliteBackend(StorageBackend):
+
+    filename:str
+    timeout:float
+
+    def __init__(self, filename:str = "fantasydata.sqlite", timeout:float = 30.0) -> None:
+        #Every table of a directory is stored in one database file
+        self.filename = filename
+        self.timeout = timeout
+
+    def path(self, directory:str) -> str:
+        return f"{directory}{self.filename}"
+
+    def connect(self, directory:str) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path(directory),timeout=self.timeout)
+        #Readers in other processes are not blocked by a writer
+        con.execute("PRAGMA journal_mode=WAL")
+        return con
+
+    def write(self, df:pd.DataFrame, directory:str, name:str) -> None:
+
+        #Lists are stored as json text, sqlite has no list type
+        df = df.copy()
+        for c in df.keys():
+            if df[c].dtype == object:
+                df[c] = [json.dumps(list(v),default=lambda x: x.item()) if isinstance(v,(list,tuple,np.ndarray)) else v for v in df[c].values]
+
+        con = self.connect(directory)
+        try:
+            with con:
+                df.to_sql(name,con,if_exists="replace",index=False)
+                for c in SQLITE_INDEX_COLUMNS:
+                    if c in df.keys():
+                        con.execute(f"CREATE INDEX IF NOT EXISTS {quote_identifier(f'{name}_{c}')} ON {quote_identifier(name)} ({quote_identifier(c)})")
+        finally:
+            con.close()
+
+    def read(self, directory:str, name:str, columns:list[str] = None) -> pd.DataFrame:
+        return self.select(directory,name,columns)
+
+    def exists(self, directory:str, name:str) -> bool:
+
+        if not os.path.exists(self.path(directory)):
+            return False
+
+        con = self.connect(directory)
+        try:
+            row = con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",(name,)).fetchone()
+        finally:
+            con.close()
+
+        return row is not None
+
+    def query(self, directory:str, sql:str, params:Union[tuple,dict] = ()) -> pd.DataFrame:
+
+        con = self.connect(directory)
+        try:
+            df = pd.read_sql_query(sql,con,params=params)
+        finally:
+            con.close()
+
+        return df
+
+    def table_columns(self, directory:str, name:str) -> list[str]:
+
+        con = self.connect(directory)
+        try:
+            rows = con.execute("SELECT name FROM pragma_table_info(?)",(name,)).fetchall()
+        finally:
+            con.close()
+
+        if len(rows) == 0:
+            raise ValueError(f"No table {name} in {self.path(directory)}")
+        return [r[0] for r in rows]
+
+    def select(self, directory:str, name:str, columns:list[str] = None, where:str = None, params:Union[tuple,dict] = ()) -> pd.DataFrame:
+
+        #The table and column names are checked against the table and quoted. where is a predicate with
+        #placeholders (e.g. "player_id = ?"), the values must always be passed in params
+        existing = self.table_columns(directory,name)
+        if columns is None:
+            columns = existing
+        unknown = [c for c in columns if c not in existing]
+        if len(unknown) > 0:
+            raise ValueError(f"Columns {unknown} not found in table {name}")
+
+        #The rows are returned in the order they were written, the loaders rely on the order of each history
+        sql = f"SELECT {','.join(quote_identifier(c) for c in columns)} FROM {quote_identifier(name)}"
+        if where is not None:
+            sql += f" WHERE {where}"
+        sql += " ORDER BY rowid"
+
+        return self.query(directory,sql,params)
+
+def quote_identifier(name:str) -> str:
+    return '"' + name.replace('"','""') + '"'
@@ -0,0 +1,187 @@
+from typing import Union
+from fantasydata.classes import Player, Team
+import pandas as pd
+import numpy as np
+
+#Types of the known history columns, applied when a column has no missing values
+HISTORY_DTYPES = {
+    "fixture": np.int64,
+    "opponent_team": np.int64,
+    "total_points": np.int64,
+    "minutes": np.int64,
+    "round": np.int64,
+    "was_home": np.bool_,
+    "team_h_score": np.int64,
+    "team_a_score": np.int64,
+    "goals_scored": np.int64,
+    "assists": np.int64,
+    "clean_sheets": np.int64,
+    "goals_conceded": np.int64,
+    "own_goals": np.int64,
+    "penalties_saved": np.int64,
+    "penalties_missed": np.int64,
+    "yellow_cards": np.int64,
+    "red_cards": np.int64,
+    "saves": np.int64,
+    "bonus": np.int64,
+    "bps": np.int64,
+    "starts": np.int64,
+    "transfers_balance": np.int64,
+    "selected": np.int64,
+    "transfers_in": np.int64,
+    "transfers_out": np.int64,
+    "current_value": np.int64,
+    "squad_adjusted_value": np.int64,
+    "chance_of_playing": np.float64,
+    "rounds": np.int64,
+    "team_id": np.int64,
+    "match_id": np.int64,
+    "value": np.int64,
+    "results": np.float64,
+    "form": np.float64,
+    "elo_before_match": np.float64,
+    "elo_after_match": np.float64,
+    "expected_result": np.float64,
+    "team_points": np.int64,
+    "n_players": np.int64,
+}
+
+class HistoryStore:
+
+    id_column:str
+    table:pd.DataFrame
+    entity_ids:np.ndarray
+    ids:np.ndarray
+    starts:np.ndarray
+    stops:np.ndarray
+    version:int
+
+    def __init__(self, table:pd.DataFrame, entity_ids:np.ndarray, id_column:str) -> None:
+        if len(table) != len(entity_ids):
+            raise ValueError(f"History table has {len(table)} rows, but {len(entity_ids)} entity ids are given")
+
+        #Rows are grouped by entity id, keeping the chronological order of each entity's history
+        order = np.argsort(entity_ids, kind="stable")
+        if (order != np.arange(len(order))).any():
+            table = table.take(order)
+            entity_ids = entity_ids[order]
+        #The copy has one block per dtype, instead of e.g. one per column of a csv file. A slice of the
+        #table then holds a few blocks, which makes the sliced histories much smaller
+        table = table.reset_index(drop=True).copy()
+
+        self.id_column = id_column
+        self.table = table
+        self.entity_ids = np.asarray(entity_ids)
+        self.version = 0
+        self._reindex()
+
+    @classmethod
+    def from_frame(cls, df:pd.DataFrame, id_column:str) -> "HistoryStore":
+        entity_ids = df[id_column].values
+        table = apply_history_dtypes(df.drop(columns=[id_column]))
+        return cls(table, entity_ids, id_column)
+
+    @classmethod
+    def from_entities(cls, entities:list[Union[Player,Team]], id_column:str) -> "HistoryStore":
+
+        frames = [e.history for e in entities if e.history is not None]
+        entity_ids = [np.full(len(e.history), e.id, dtype=np.int64) for e in entities if e.history is not None]
+
+        if len(frames) == 0:
+            return cls(pd.DataFrame(), np.zeros(0, dtype=np.int64), id_column)
+
+        #One concatenation of all histories instead of one frame per entity
+        table = apply_history_dtypes(pd.concat(frames, ignore_index=True))
+        return cls(table, np.concatenate(entity_ids), id_column)
+
+    def _reindex(self) -> None:
+
+        n = len(self.entity_ids)
+        if n == 0:
+            boundaries = np.zeros(0, dtype=np.int64)
+        else:
+            boundaries = np.flatnonzero(np.r_[True, self.entity_ids[1:] != self.entity_ids[:-1]])
+
+        self.ids = self.entity_ids[boundaries]
+        self.starts = boundaries
+        self.stops = np.r_[boundaries[1:], n].astype(np.int64)
+        self._offsets = {i:(start,stop) for i,start,stop in zip(self.ids.tolist(),self.starts.tolist(),self.stops.tolist())}
+
+    @property
+    def positions(self) -> np.ndarray:
+        #Position of every row within the history of its entity
+        return np.arange(len(self.entity_ids)) - np.repeat(self.starts, self.stops - self.starts)
+
+    @property
+    def group_index(self) -> np.ndarray:
+        #Index of the entity (in self.ids) that every row belongs to
+        return np.repeat(np.arange(len(self.ids)), self.stops - self.starts)
+
+    def __contains__(self, entity_id:int) -> bool:
+        return entity_id in self._offsets
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def view(self, entity_id:int) -> pd.DataFrame:
+
+        try:
+            start,stop = self._offsets[entity_id]
+        except KeyError:
+            raise ValueError(f"Entity with {self.id_column} {entity_id} not found in history store") from None
+
+        #A row slice shares the column arrays of the table, only the index is new
+        df = self.table.iloc[start:stop]
+        df.index = pd.RangeIndex(stop-start)
+        return df
+
+    def attach(self, entities:list[Union[Player,Team]]) -> None:
+
+        #The attached entities slice their history from the table when it is used. Entities without
+        #rows in the store keep their current history
+        for e in entities:
+            if e.id in self._offsets:
+                e.attach_history_store(self)
+
+    def column(self, name:str) -> np.ndarray:
+        return self.table[name].values
+
+    def set_column(self, name:str, values:np.ndarray) -> None:
+        self.set_columns({name:values})
+
+    def set_columns(self, columns:dict[str,np.ndarray]) -> None:
+
+        for name,values in columns.items():
+            if len(values) != len(self.table):
+                raise ValueError(f"Column {name} has {len(values)} values, but the history store has {len(self.table)} rows")
+            self.table[name] = values
+        self.table = self.table.copy()
+
+        #Histories that were sliced before this change are sliced again when they are used
+        self.version += 1
+
+    def to_frame(self) -> pd.DataFrame:
+        df = self.table.copy()
+        df.insert(0, self.id_column, self.entity_ids)
+        return df
+
+    def memory_usage(self) -> int:
+        return int(self.table.memory_usage(index=True, deep=True).sum() + self.entity_ids.nbytes)
+
+    def __str__(self) -> str:
+        return f"History store with {len(self.ids)} entities, {len(self.table)} rows and {len(self.table.columns)} columns\n"
+
+def apply_history_dtypes(df:pd.DataFrame) -> pd.DataFrame:
+
+    for name,dtype in HISTORY_DTYPES.items():
+        if name not in df.keys() or df[name].dtype == dtype:
+            continue
+        values = df[name]
+        if values.isna().any():
+            continue
+        try:
+            df[name] = values.astype(dtype)
+        except (ValueError, TypeError):
+            pass
+
+    return df
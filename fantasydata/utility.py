@@ -1,9 +1,16 @@
 from typing import Union
 from fantasydata.classes import Player, Team, Squad, Match
+from fantasydata.store import HistoryStore, apply_history_dtypes
+from fantasydata.storage import StorageBackend, CsvBackend
 import pandas as pd
+import numpy as np
 import math
 
-def string_to_int_list(s:str) -> list[int]:
+def string_to_int_list(s:Union[str,list[int]]) -> list[int]:
+
+    #Backends with native list columns return the list itself
+    if not isinstance(s,str):
+        return [int(val) for val in s]
 
     s = s.replace("[","")
     s = s.replace("]","")
@@ -65,117 +72,141 @@ def get_next_round(matches:list[Match]) -> int:
             return m.round
     return -1
 
+def has_history(o:Union[Player,Team]) -> bool:
+
+    #Entities without matches are read from file with a single row of missing values
+    if o.history is None or len(o.history) == 0:
+        return False
+    for key in ["fixture","match_id"]:
+        if key in o.history.keys():
+            return not pd.isna(o.history[key].values).all()
+    return True
+
 def list_to_dataframe(object_list:list[Union[Player,Team,Match]]) -> pd.DataFrame:
-    
-    df = pd.DataFrame()
-    for o in object_list:
-        o_as_df = o.to_dataframe()
-        df = pd.concat([df,o_as_df])
 
-    df.reset_index(drop=True, inplace=True)
+    if len(object_list) == 0:
+        return pd.DataFrame()
+
+    #The history rows and the attributes of all objects are gathered first and combined into one frame,
+    #objects without history (or matches, which have none) get a single row
+    histories = []
+    lengths = np.ones(len(object_list), dtype=np.int64)
+    for i,o in enumerate(object_list):
+        history = getattr(o,"history",None)
+        if history is None:
+            histories.append(pd.DataFrame(index=pd.RangeIndex(1)))
+        else:
+            histories.append(history)
+            lengths[i] = len(history)
+
+    df = pd.concat(histories, ignore_index=True)
+
+    attributes = [o.attributes() for o in object_list]
+    last_rows = np.cumsum(lengths) - 1
+    columns = {}
+    for k in attributes[0].keys():
+        values = [a[k] for a in attributes]
+        if isinstance(values[0],list):
+            #List attributes are only stored in the last row of each object
+            column = np.full(len(df), None, dtype=object)
+            for i,v,n in zip(last_rows,values,lengths):
+                if n > 0:
+                    column[i] = v
+            columns[k] = column
+        else:
+            columns[k] = pd.Series(values).repeat(lengths).to_numpy()
+
+    df = pd.concat([df.drop(columns=[k for k in columns if k in df.keys()]), pd.DataFrame(columns)], axis=1)
 
     return df
 
-def dataframe_to_players(df:pd.DataFrame) -> list[Player]:
+def group_last_rows(ids:np.ndarray) -> np.ndarray:
+    #Index of the last row of each group of equal, consecutive ids
+    return np.flatnonzero(np.r_[ids[1:] != ids[:-1], True])
 
-    players = []
-    player_ids = set(df["player_id"])
+def dataframe_to_entity_histories(df:pd.DataFrame, id_column:str, entity_columns:list[str], entities:list[Union[Player,Team]], key:str) -> None:
 
-    for player_id in player_ids:
-        player_df = df[df["player_id"] == player_id]
+    history_df = df.drop(columns=entity_columns)
+    if len(history_df.keys()) == 1:
+        return
 
-        name = player_df["name"].values[-1]
-        position = player_df["position"].values[-1]
-        current_team_id = int(player_df["current_team_id"].values[-1])
-        current_team_name = player_df["current_team_name"].values[-1]
-        current_value = int(player_df["current_value"].values[-1])
-        squad_adjusted_value = int(player_df["squad_adjusted_value"].values[-1])
-        chance_of_playing = player_df["chance_of_playing"].values[-1]
+    #Entities without matches have a single row of missing values, they get their own frame so
+    #that missing values do not prevent the int columns of the shared table from being int
+    if key in history_df.keys():
+        has_history = history_df[key].notna().groupby(df[id_column].values).transform("any").values
+    else:
+        has_history = np.ones(len(df), dtype=bool)
 
-        p = Player(player_id,name,position,current_team_id,current_team_name,current_value)
-        p.squad_adjusted_value = squad_adjusted_value
-        p.chance_of_playing = chance_of_playing
+    HistoryStore.from_frame(history_df[has_history], id_column).attach(entities)
+
+    if has_history.all():
+        return
 
-        history = player_df.drop(columns=["player_id","name","position","current_team_id","current_team_name"])
+    entities_by_id = {e.id:e for e in entities}
+    for entity_id,history in history_df[~has_history].groupby(id_column, sort=False):
+        history = apply_history_dtypes(history.drop(columns=[id_column]))
         history.reset_index(drop=True, inplace=True)
+        entities_by_id[entity_id].history = history
 
-        for attr in history.keys():
-            if attr in ["ict_index","threat","creativity","influence","predicted_points","form"]:
-                continue
-            else:
-                try:
-                    history[attr] = history[attr].astype(int)
-                except ValueError:
-                    pass
+def dataframe_to_players(df:pd.DataFrame) -> list[Player]:
+
+    #One stable sort by id replaces a boolean mask per player, each player's rows stay in file order
+    df = df.sort_values("player_id", kind="stable", ignore_index=True)
+    last = df.iloc[group_last_rows(df["player_id"].values)]
 
-        if len(history.keys()) != 0:
-            p.history = history
+    players = []
+    columns = ["player_id","name","position","current_team_id","current_team_name","current_value","squad_adjusted_value","chance_of_playing"]
+    for player_id,name,position,current_team_id,current_team_name,current_value,squad_adjusted_value,chance_of_playing in zip(*[last[c].values for c in columns]):
+
+        p = Player(int(player_id),name,position,int(current_team_id),current_team_name,int(current_value))
+        p.squad_adjusted_value = int(squad_adjusted_value)
+        p.chance_of_playing = chance_of_playing
 
         players.append(p)
 
-    return players
+    dataframe_to_entity_histories(df,"player_id",["name","position","current_team_id","current_team_name"],players,"fixture")
 
+    return players
 
 def dataframe_to_teams(df:pd.DataFrame) -> list[Team]:
 
-    teams = []
-    team_ids = set(df["team_id"])
+    df = df.sort_values("team_id", kind="stable", ignore_index=True)
+    last = df.iloc[group_last_rows(df["team_id"].values)]
 
-    for team_id in team_ids:
-        team_df = df[df["team_id"] == team_id]
-
-        name = team_df["name"].values[-1]
-        team_code = int(team_df["team_code"].values[-1])
-        current_player_ids = team_df["current_player_ids"].values[-1]
+    teams = []
+    for team_id,name,team_code,current_player_ids in zip(*[last[c].values for c in ["team_id","name","team_code","current_player_ids"]]):
 
+        t = Team(int(team_id),name,int(team_code))
         #The list of ids is read as a string and must be converted back to a list of ints
-        current_player_ids = string_to_int_list(current_player_ids)
-
-        t = Team(team_id,name,team_code)
-        t.current_player_ids = current_player_ids
-
-        history = team_df.drop(columns=["team_id","name","team_code","current_player_ids"])
-        history.reset_index(drop=True, inplace=True)
-
-        if len(history.keys()) != 0:
-            t.history = history
+        t.current_player_ids = string_to_int_list(current_player_ids)
 
         teams.append(t)
 
+    dataframe_to_entity_histories(df,"team_id",["name","team_code","current_player_ids"],teams,"match_id")
+
     return teams    
     
 def dataframe_to_matches(df:pd.DataFrame) -> list[Match]:
 
+    df = df.drop_duplicates("id", keep="last")
+    has_scores = "delta_elo" in df.keys()
+
     matches = []
-    match_ids = set(df["id"])
-
-    for match_id in match_ids:
-        match_df = df[df["id"] == match_id]
-        try:
-            round = int(match_df["round"].values[-1])
-        except ValueError:
-            round = match_df["round"].values[-1]
-        home_team_name = match_df["home_team_name"].values[-1]
-        away_team_name = match_df["away_team_name"].values[-1]
-        home_team_id = int(match_df["home_team_id"].values[-1])
-        away_team_id = int(match_df["away_team_id"].values[-1])
-        start_time = pd.Timestamp(match_df["start_time"].values[-1])
-        home_goals = int(match_df["home_goals"].values[-1])
-        away_goals = int(match_df["away_goals"].values[-1])
-        finished = bool(match_df["finished"].values[-1])
+    for row in df.itertuples(index=False):
+
+        round = row.round if pd.isna(row.round) else int(row.round)
+        start_time = pd.Timestamp(row.start_time)
         
-        if finished:
-            m = Match(match_id,round,home_team_name,home_team_id,away_team_name,away_team_id,start_time,finished=True,home_goals=home_goals,away_goals=away_goals)
+        if bool(row.finished):
+            m = Match(int(row.id),round,row.home_team_name,int(row.home_team_id),row.away_team_name,int(row.away_team_id),start_time,finished=True,home_goals=int(row.home_goals),away_goals=int(row.away_goals))
         else:
-            m = Match(match_id,round,home_team_name,home_team_id,away_team_name,away_team_id,start_time)
+            m = Match(int(row.id),round,row.home_team_name,int(row.home_team_id),row.away_team_name,int(row.away_team_id),start_time)
 
-        try:
-            m.delta_elo = match_df["delta_elo"].values[-1]
-            m.delta_form = match_df["delta_form"].values[-1]
-            m.expected_home_score = match_df["expected_home_score"].values[-1]
-            m.expected_away_score = match_df["expected_away_score"].values[-1]
-        except KeyError:
-            pass
+        if has_scores:
+            m.delta_elo = row.delta_elo
+            m.delta_form = row.delta_form
+            m.expected_home_score = row.expected_home_score
+            m.expected_away_score = row.expected_away_score
 
         matches.append(m)
 
@@ -195,36 +226,62 @@ def dataframe_to_squad(df:pd.DataFrame) -> Squad:
 
     return s        
 
-def save_all_data(directory:str, players:list[Player], teams:list[Team], matches:list[Match], squad:Squad, suffix:str = "raw") -> None:
+def save_all_data(directory:str, players:list[Player], teams:list[Team], matches:list[Match], squad:Squad, suffix:str = "raw", backend:StorageBackend = None) -> None:
+
+    if backend is None:
+        backend = CsvBackend()
 
     player_df = list_to_dataframe(players)
-    player_df.to_csv(f"{directory}players_{suffix}.csv",sep=";",index=False)
+    backend.write(player_df,directory,f"players_{suffix}")
 
     team_df = list_to_dataframe(teams)
-    team_df.to_csv(f"{directory}teams_{suffix}.csv",sep=";",index=False)
+    backend.write(team_df,directory,f"teams_{suffix}")
 
     match_df = list_to_dataframe(matches)
-    match_df.to_csv(f"{directory}matches_{suffix}.csv",sep=";",index=False)
+    backend.write(match_df,directory,f"matches_{suffix}")
 
     squad_df = squad.to_dataframe()
-    squad_df.to_csv(f"{directory}squad_{squad.id}_{suffix}.csv",sep=";",index=False)
+    backend.write(squad_df,directory,f"squad_{squad.id}_{suffix}")
 
-def read_main_data_from_csv(directory:str, suffix:str = "raw") -> tuple[list[Player],list[Team],list[Match]]:
+def read_main_data(directory:str, suffix:str = "raw", backend:StorageBackend = None) -> tuple[list[Player],list[Team],list[Match]]:
+
+    if backend is None:
+        backend = CsvBackend()
 
-    player_df = pd.read_csv(f"{directory}players_{suffix}.csv",sep=";")
+    player_df = backend.read(directory,f"players_{suffix}")
     players = dataframe_to_players(player_df)
 
-    team_df = pd.read_csv(f"{directory}teams_{suffix}.csv",sep=";")
+    team_df = backend.read(directory,f"teams_{suffix}")
     teams = dataframe_to_teams(team_df)  
 
-    match_df = pd.read_csv(f"{directory}matches_{suffix}.csv",sep=";")
+    match_df = backend.read(directory,f"matches_{suffix}")
     matches = dataframe_to_matches(match_df)           
 
     return players,teams,matches    
 
-def read_squad_data_from_csv(directory:str, squad_id:int, suffix:str = "raw") -> Squad:
+def read_main_data_from_csv(directory:str, suffix:str = "raw") -> tuple[list[Player],list[Team],list[Match]]:
+    return read_main_data(directory,suffix,CsvBackend())
+
+def read_player_table(directory:str, columns:list[str], suffix:str = "raw", backend:StorageBackend = None) -> pd.DataFrame:
+
+    #For consumers that only need a few columns of the player histories, no Player objects are created
+    if backend is None:
+        backend = CsvBackend()
+
+    if "player_id" not in columns:
+        columns = ["player_id"] + list(columns)
 
-    squad_df = pd.read_csv(f"{directory}squad_{squad_id}_{suffix}.csv",sep=";")
+    return backend.read(directory,f"players_{suffix}",columns)
+
+def read_squad_data(directory:str, squad_id:int, suffix:str = "raw", backend:StorageBackend = None) -> Squad:
+
+    if backend is None:
+        backend = CsvBackend()
+
+    squad_df = backend.read(directory,f"squad_{squad_id}_{suffix}")
     squad = dataframe_to_squad(squad_df)        
 
-    return squad       
\ No newline at end of file
+    return squad
+
+def read_squad_data_from_csv(directory:str, squad_id:int, suffix:str = "raw") -> Squad:
+    return read_squad_data(directory,squad_id,suffix,CsvBackend())
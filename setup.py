@@ -9,6 +9,7 @@ setup(
     author='Christian Øyn Naversen',
     author_email='christian.oyn.naversen@gmail.com',
     install_requires=['pandas>=1.3.2','requests','numpy>=1.20.2','statsmodels>=0.12.2'],
+    extras_require={'fast':['orjson'],'parquet':['pyarrow']},
     license='MIT',
     classifiers=[
         'Development Status :: 1 - Planning',
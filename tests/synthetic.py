@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+from fantasydata.classes import Player, Team, Match, Squad
+from fantasydata.replay import record_response
+import json
+
+def make_season(n_players:int = 120, n_teams:int = 10, n_finished_rounds:int = 8, n_finished_next_round:int = 0, seed:int = 0) -> tuple[list[Player],list[Team],list[Match],Squad,pd.DataFrame]:
+
+    #A double round robin season where the first n_finished_rounds rounds are played, and the first
+    #n_finished_next_round matches of the round after that. One match is postponed to the last round
+    rng = np.random.default_rng(seed)
+    teams = [Team(i+1,f"Team {i+1}",100+i) for i in range(n_teams)]
+
+    ids = list(range(1,n_teams+1))
+    rounds = []
+    for _ in range(n_teams-1):
+        rounds.append([(ids[i],ids[-1-i]) for i in range(n_teams//2)])
+        ids = [ids[0]] + [ids[-1]] + ids[1:-1]
+    rounds = rounds + [[(a,h) for h,a in pairs] for pairs in rounds]
+
+    matches = []
+    start = pd.Timestamp("2026-08-10T14:00:00Z")
+    for r,pairs in enumerate(rounds,start=1):
+        for k,(home,away) in enumerate(pairs):
+            match_round = r
+            start_time = start + pd.Timedelta(days=7*(r-1),hours=k)
+            if r == 2 and k == 0:
+                match_round = len(rounds)
+                start_time = start + pd.Timedelta(days=7*(len(rounds)-1),hours=20)
+
+            #The goals are drawn for every match, so that seasons with more finished matches have the same results
+            home_goals,away_goals = int(rng.poisson(1.5)),int(rng.poisson(1.2))
+            finished = match_round <= n_finished_rounds or (match_round == n_finished_rounds+1 and k < n_finished_next_round)
+            h = teams[home-1]
+            a = teams[away-1]
+            if finished:
+                m = Match(len(matches)+1,match_round,h.name,h.id,a.name,a.id,start_time,home_goals,away_goals,True)
+            else:
+                m = Match(len(matches)+1,match_round,h.name,h.id,a.name,a.id,start_time)
+            matches.append(m)
+    matches = sorted(matches,key=lambda m: m.start_time)
+
+    players = []
+    positions = ["gkp","def","mid","fwd"]
+    for player_id in range(1,n_players+1):
+        team = teams[player_id % n_teams]
+        p = Player(player_id,f"Player {player_id}",positions[player_id % 4],team.id,team.name,int(40+rng.integers(0,80)))
+        team.add_current_player(p)
+        players.append(p)
+
+        #Some players have no history, and some joined in the last played round
+        if player_id % 41 == 0:
+            continue
+        first_round = n_finished_rounds if player_id % 23 == 0 else 1
+
+        #One random stream per player and match, so the rows do not depend on which matches are finished
+        rows = []
+        skill = rng.gamma(2.0,1.2)
+        for m in matches:
+            if not m.finished or m.round < first_round or team.id not in (m.home_team_id,m.away_team_id):
+                continue
+            row_rng = np.random.default_rng([seed,player_id,m.id])
+            home = team.id == m.home_team_id
+            minutes = int(row_rng.choice([0,90,90,60,20]))
+            rows.append({
+                "fixture": m.id,
+                "opponent_team": m.away_team_id if home else m.home_team_id,
+                "total_points": int(row_rng.poisson(skill)) if minutes > 0 else 0,
+                "was_home": home,
+                "minutes": minutes,
+                "value": p.current_value + int(row_rng.integers(-3,3)),
+            })
+        p.history = pd.DataFrame(rows)
+
+    pool = [p.id for p in players if p.history is not None and len(p.history) > 3]
+    current = [int(i) for i in rng.choice(pool,15,replace=False)]
+    rows = []
+    for r in range(1,n_finished_rounds+2):
+        if r % 3 == 0:
+            current = current[1:] + [int(rng.choice([i for i in pool if i not in current]))]
+        rows.append({"round": r, "bank": int(rng.integers(0,30)), "event_transfers": int(r % 3 == 0), "n_free_transfers": 1, "player_ids": list(current)})
+    squad = Squad(7,"my_squad",history=pd.DataFrame(rows))
+
+    initial_elo = pd.DataFrame({"team_name": [t.name for t in teams], "elo": [1000.0 + 10*i for i in range(n_teams)]})
+
+    return players,teams,matches,squad,initial_elo
+
+def write_api_recordings(directory:str, n_players:int = 45, n_teams:int = 6, n_finished_rounds:int = 5, squad_id:int = 7, first_squad_round:int = 1) -> None:
+
+    #A small season in the format of the FPL API, served by fantasydata.replay.ReplayServer
+    players,teams,matches,squad,_ = make_season(n_players,n_teams,n_finished_rounds)
+    url_base = "http://localhost/"
+    rounds = sorted({m.round for m in matches})
+
+    events = [{"id": r, "is_current": r == n_finished_rounds, "finished": r <= n_finished_rounds} for r in rounds]
+    team_data = [{"id": t.id, "name": t.name, "code": t.code, "unavailable": False} for t in teams]
+    codes = {t.id:t.code for t in teams}
+    elements = []
+    for p in players:
+        has_history = p.history is not None and len(p.history) != 0
+        elements.append({
+            "id": p.id, "web_name": p.name, "element_type": ["gkp","def","mid","fwd"].index(p.position)+1,
+            "team_code": codes[p.current_team_id], "now_cost": p.current_value, "chance_of_playing_next_round": None,
+            "total_points": int(p.history["total_points"].sum()) if has_history else 0,
+            "minutes": int(p.history["minutes"].sum()) if has_history else 0, "first_name": "Unused",
+        })
+    bootstrap = {"events": events, "teams": team_data, "elements": elements}
+    record_response(directory,f"{url_base}bootstrap-static/",json.dumps(bootstrap).encode())
+
+    for p in players:
+        history = [] if p.history is None else [{"element": p.id, **row} for row in p.history.to_dict("records")]
+        summary = {"history": history, "fixtures": [], "history_past": []}
+        record_response(directory,f"{url_base}element-summary/{p.id}/",json.dumps(summary,default=int).encode())
+
+    fixtures = []
+    for m in matches:
+        fixtures.append({
+            "id": m.id, "event": m.round, "kickoff_time": m.start_time.isoformat(), "team_h": m.home_team_id, "team_a": m.away_team_id,
+            "team_h_score": m.home_goals if m.finished else None, "team_a_score": m.away_goals if m.finished else None, "finished": m.finished,
+        })
+    record_response(directory,f"{url_base}fixtures/",json.dumps(fixtures,default=int).encode())
+
+    for row in squad.history.to_dict("records"):
+        if row["round"] < first_squad_round or row["round"] > n_finished_rounds:
+            continue
+        picks = {
+            "entry_history": {"event": row["round"], "bank": row["bank"], "event_transfers": row["event_transfers"]},
+            "active_chip": None, "picks": [{"element": i} for i in row["player_ids"]],
+        }
+        record_response(directory,f"{url_base}entry/{squad_id}/event/{row['round']}/picks/",json.dumps(picks,default=int).encode())
@@ -0,0 +1,98 @@
+import json
+import time
+import fantasydata.get_data as gd
+from fantasydata.cache import ResponseCache
+from fantasydata.replay import ReplayServer
+from synthetic import write_api_recordings
+
+def test_entries_expire_after_ttl(tmp_path):
+
+    cache = ResponseCache(str(tmp_path),ttl={"other": 0.2})
+    url = "http://localhost/some/endpoint/"
+    cache.put(url,json.dumps({"a": 1}).encode())
+
+    assert cache.get(url) == {"a": 1}
+    assert cache.get(url,decode=lambda c: len(c)) == len(json.dumps({"a": 1}))
+    time.sleep(0.3)
+    assert cache.get(url) is None
+    assert cache.get_content(url) is None
+    assert (cache.hits,cache.misses) == (2,2)
+
+def test_corrupt_body_is_a_miss(tmp_path):
+
+    cache = ResponseCache(str(tmp_path))
+    url = "http://localhost/some/endpoint/"
+    cache.put(url,b"{not json")
+    assert cache.get(url) is None
+    assert cache.get_content(url) == b"{not json"
+    assert (cache.hits,cache.misses) == (1,1)
+
+def test_stale_entries_are_revalidated(tmp_path):
+
+    recordings = tmp_path / "recordings"
+    write_api_recordings(str(recordings))
+    cache = ResponseCache(str(tmp_path / "cache"),ttl={"fixtures": 0.0})
+
+    with ReplayServer(str(recordings)) as server:
+        url = f"{server.url}fixtures/"
+        first = gd.get_data(url,cache)
+        headers = cache.conditional_headers(url)
+        second = gd.get_data(url,cache)
+
+    #The replay server sends both an ETag and Last-Modified, the ETag matches and the answer is 304
+    assert "If-None-Match" in headers and "If-Modified-Since" in headers
+    assert first == second
+    assert (cache.hits,cache.misses,cache.revalidated) == (0,2,1)
+
+def test_eviction_during_revalidation(tmp_path):
+
+    recordings = tmp_path / "recordings"
+    write_api_recordings(str(recordings))
+    cache = ResponseCache(str(tmp_path / "cache"),ttl={"fixtures": 0.0})
+
+    with ReplayServer(str(recordings)) as server:
+        url = f"{server.url}fixtures/"
+        first = gd.get_data(url,cache)
+
+        #The entry is evicted between the conditional request and the 304 answer, the url is fetched again
+        conditional_headers = cache.conditional_headers
+        def evicting_headers(url:str) -> dict[str,str]:
+            headers = conditional_headers(url)
+            cache.clear()
+            return headers
+        cache.conditional_headers = evicting_headers
+
+        second = gd.get_data(url,cache)
+        n_requests = server.n_requests
+
+    assert first == second
+    assert cache.revalidated == 0
+    assert n_requests == 3
+    assert cache.size() > 0
+
+    cache.clear()
+    assert cache.revalidate(url) is None
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+
+    content = b"[" + b"1,"*499 + b"1]"
+    cache = ResponseCache(str(tmp_path),max_bytes=3*len(content))
+    urls = [f"http://localhost/endpoint/{i}/" for i in range(3)]
+
+    cache.put(urls[0],content)
+    time.sleep(0.01)
+    cache.put(urls[1],content)
+    time.sleep(0.01)
+    assert cache.get(urls[0]) is not None
+    time.sleep(0.01)
+    cache.put(urls[2],content)
+
+    assert cache.evicted == 1
+    assert cache.size() <= cache.max_bytes
+    assert cache.get(urls[1]) is None
+    assert cache.get(urls[0]) is not None and cache.get(urls[2]) is not None
+
+    #The access order survives a restart
+    cache = ResponseCache(str(tmp_path),max_bytes=2*len(content))
+    assert cache.evicted == 1
+    assert cache.get(urls[0]) is None and cache.get(urls[2]) is not None
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import pytest
+import fantasydata.process_data as pr
+from fantasydata.classes import SquadOwnership
+from fantasydata.pipeline import IncrementalPipeline
+from synthetic import make_season
+
+def last_value(history:pd.DataFrame, column:str, default:float) -> float:
+    if history is None or len(history[column]) < 1:
+        return default
+    return history[column].values[-1]
+
+def test_cached_current_state_matches_history():
+
+    #The cached current values must be the same as reading the last history row after every stage
+    #that changes the histories, also the stages that modify them in place
+    players,teams,matches,squad,initial_elo = make_season()
+
+    #Read before processing, so that a stale cache would be returned afterwards
+    assert all(t.current_elo == t.initial_elo and t.current_form == 0.5 for t in teams)
+
+    pr.add_calculated_attributes(players,teams,matches,squad,initial_elo)
+
+    for p in players:
+        assert p.current_form == last_value(p.history,"form",1.0)
+    for t in teams:
+        assert t.current_elo == last_value(t.history,"elo_after_match",t.initial_elo)
+        assert t.current_form == last_value(t.history,"form",0.5)
+
+    assert squad.current_bank == squad.history["bank"].values[-1]
+    assert squad.current_players == squad.history["player_ids"].values[-1]
+
+def test_cache_is_cleared_on_assignment():
+
+    players,teams,_,_,_ = make_season()
+    p = next(p for p in players if p.history is not None)
+
+    p.history = pd.DataFrame({"form":[1.0,2.0]})
+    assert p.current_form == 2.0
+    p.history = pd.DataFrame({"form":[3.0]})
+    assert p.current_form == 3.0
+
+    t = teams[0]
+    t.initial_elo = 1234.0
+    assert t.current_elo == 1234.0
+    t.history = pd.DataFrame({"elo_after_match":[1100.0],"form":[0.7]})
+    assert t.current_elo == 1100.0 and t.current_form == 0.7
+
+    #In place modifications are only seen after invalidate_cache
+    t.history["elo_after_match"] = np.array([1200.0])
+    t.invalidate_cache()
+    assert t.current_elo == 1200.0
+
+def test_entities_have_slots():
+    players,teams,matches,squad,_ = make_season()
+    for o in [players[0],teams[0],matches[0],squad]:
+        with pytest.raises(AttributeError):
+            o.not_an_attribute = 1
+
+def test_ownership_is_rebuilt_when_earlier_rows_change():
+
+    _,_,_,squad,_ = make_season()
+    ownership = SquadOwnership.from_squads([squad])
+
+    #The same number of rows, but another player was bought in the third round
+    history = squad.history.copy()
+    bought = next(i for i in range(1,200) if i not in history["player_ids"].values[2])
+    history["player_ids"] = [ids if r < 3 else [bought if i == ids[0] else i for i in ids] for r,ids in zip(history["round"],history["player_ids"])]
+    squad.history = history
+    ownership.update(squad)
+    assert ownership.acquisitions == pytest.approx(SquadOwnership.from_squads([squad]).acquisitions,nan_ok=True)
+    assert ownership.acquisitions[(squad.id,bought)] == 3.0
+
+    #More rows and a changed first row
+    longer = pd.concat([history,history.iloc[-1:].assign(round=history["round"].values[-1]+1)],ignore_index=True)
+    longer.at[0,"player_ids"] = list(longer["player_ids"].values[1])
+    squad.history = longer
+    ownership.update(squad)
+    assert ownership.acquisitions == pytest.approx(SquadOwnership.from_squads([squad]).acquisitions,nan_ok=True)
+
+def test_pipeline_keeps_the_ownership_index(tmp_path):
+
+    directory = f"{tmp_path}/"
+    players,teams,matches,squad,initial_elo = make_season(n_finished_rounds=7)
+    IncrementalPipeline(directory).run(players,teams,matches,squad,initial_elo)
+
+    pipeline = IncrementalPipeline(directory)
+    assert pipeline.ownership.acquisitions == pytest.approx(SquadOwnership.from_squads([squad]).acquisitions,nan_ok=True)
+
+    players,teams,matches,squad,initial_elo = make_season()
+    pipeline.run(players,teams,matches,squad,initial_elo)
+    full_players,full_teams,full_matches,full_squad,_ = make_season()
+    pr.add_calculated_attributes(full_players,full_teams,full_matches,full_squad,initial_elo,ownership=SquadOwnership())
+    assert [p.squad_adjusted_value for p in players] == [p.squad_adjusted_value for p in full_players]
+    assert pipeline.ownership.acquisitions == pytest.approx(SquadOwnership.from_squads([squad]).acquisitions,nan_ok=True)
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+import fantasydata.process_data as pr
+from fantasydata.elo import EloEngine
+from fantasydata.pipeline import IncrementalPipeline
+from synthetic import make_season
+
+def test_finished_next_round_match_does_not_update_elo():
+
+    #A match of the next round that is already played (mid-week) is in the team tables, but the
+    #ratings are only updated when the whole round is finished
+    players,teams,matches,squad,initial_elo = make_season(n_finished_next_round=1)
+    engine = EloEngine()
+    pr.add_calculated_attributes(players,teams,matches,squad,initial_elo,elo_engine=engine)
+
+    _,full_teams,full_matches,_,_ = make_season()
+    full_engine = EloEngine()
+    full_engine.set_initial_ratings(full_teams,initial_elo)
+    full_engine.apply_all([m for m in full_matches if m.finished])
+    assert engine.ratings == full_engine.ratings
+
+    played = next(m for m in matches if m.round == 9 and m.finished)
+    for t in teams:
+        assert len(t.history) == len(t.history["elo_before_match"])
+        if t.id in (played.home_team_id,played.away_team_id):
+            last = t.history.iloc[-1]
+            assert last["match_id"] == played.id
+            assert last["elo_before_match"] == last["elo_after_match"] == engine.rating(t.id) == t.current_elo
+
+    expected = played.expected_home_score
+    home = next(t for t in teams if t.id == played.home_team_id)
+    assert home.history["expected_result"].values[-1] == pytest.approx(expected)
+
+def test_pipeline_resumes_after_a_mid_week_match(tmp_path):
+
+    #The pipeline is run mid-week and again when the round is finished, the result must be the same
+    #as processing the finished round from scratch
+    directory = f"{tmp_path}/"
+    players,teams,matches,squad,initial_elo = make_season(n_finished_next_round=1)
+    IncrementalPipeline(directory).run(players,teams,matches,squad,initial_elo)
+
+    players,teams,matches,squad,initial_elo = make_season(n_finished_rounds=9)
+    IncrementalPipeline(directory).run(players,teams,matches,squad,initial_elo)
+
+    full_players,full_teams,full_matches,full_squad,_ = make_season(n_finished_rounds=9)
+    pr.add_calculated_attributes(full_players,full_teams,full_matches,full_squad,initial_elo)
+
+    for t,u in zip(teams,full_teams):
+        for c in ["match_id","results","elo_before_match","elo_after_match","expected_result","team_points"]:
+            assert np.allclose(t.history[c].values,u.history[c].values,rtol=1e-12,atol=1e-12)
+    for p,q in zip(players,full_players):
+        if p.history is not None and "form" in q.history.keys():
+            assert np.allclose(p.history["form"].values,q.history["form"].values,equal_nan=True)
+
+def test_pipeline_replays_when_the_initial_elo_changes(tmp_path):
+
+    directory = f"{tmp_path}/"
+    players,teams,matches,squad,initial_elo = make_season()
+    IncrementalPipeline(directory).run(players,teams,matches,squad,initial_elo)
+
+    corrected = initial_elo.copy()
+    corrected.loc[0,"elo"] += 50.0
+    players,teams,matches,squad,_ = make_season()
+    IncrementalPipeline(directory).run(players,teams,matches,squad,corrected)
+
+    full_players,full_teams,full_matches,full_squad,_ = make_season()
+    pr.add_calculated_attributes(full_players,full_teams,full_matches,full_squad,corrected)
+
+    assert teams[0].initial_elo == corrected["elo"].values[0]
+    for t,u in zip(teams,full_teams):
+        for c in ["elo_before_match","elo_after_match","expected_result"]:
+            assert np.allclose(t.history[c].values,u.history[c].values,rtol=1e-12,atol=1e-12)
@@ -0,0 +1,124 @@
+import threading
+import time
+import pytest
+import fantasydata.get_data as gd
+from fantasydata.fetch import FetchEngine, HttpStatusError, TokenBucket
+from fantasydata.replay import ReplayServer
+from synthetic import write_api_recordings
+
+class FakeFetch:
+
+    #Fails the first n_failures requests of every url with the given status code
+    def __init__(self, n_failures:int = 0, status_code:int = 503) -> None:
+        self.n_failures = n_failures
+        self.status_code = status_code
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url:str) -> str:
+        with self._lock:
+            self.calls[url] = self.calls.get(url,0) + 1
+            n = self.calls[url]
+        if n <= self.n_failures:
+            raise HttpStatusError(f"Error retreiving data from {url}, statuscode: {self.status_code}", self.status_code)
+        return url.upper()
+
+def test_retries_until_success():
+
+    fetch = FakeFetch(n_failures=2)
+    engine = FetchEngine(fetch,rate=1000.0,burst=1000.0,backoff_base=0.001)
+    urls = [f"u{i}" for i in range(5)]
+    results,report = engine.fetch_all(urls)
+
+    assert results == {u:u.upper() for u in urls}
+    assert report.n_ok == 5 and report.n_retries == 10
+    assert all(o.attempts == 3 for o in report.outcomes)
+
+def test_gives_up_after_max_retries():
+
+    fetch = FakeFetch(n_failures=10)
+    engine = FetchEngine(fetch,rate=1000.0,burst=1000.0,max_retries=2,backoff_base=0.001)
+    results,report = engine.fetch_all(["a"])
+
+    assert results == {}
+    assert report.n_failed == 1 and report.outcomes[0].attempts == 3
+    assert "503" in report.outcomes[0].error
+
+@pytest.mark.parametrize("status_code,n_calls",[(404,1),(403,1),(429,3),(500,3)])
+def test_client_errors_are_not_retried(status_code, n_calls):
+
+    fetch = FakeFetch(n_failures=10,status_code=status_code)
+    engine = FetchEngine(fetch,rate=1000.0,burst=1000.0,max_retries=2,backoff_base=0.001)
+    _,report = engine.fetch_all(["a"])
+
+    assert fetch.calls["a"] == n_calls
+    assert report.outcomes[0].attempts == n_calls
+    assert report.outcomes[0].status_code == status_code
+
+def test_backoff_is_bounded_and_grows():
+
+    engine = FetchEngine(FakeFetch(),backoff_base=0.5,backoff_max=3.0)
+    for attempt in range(6):
+        times = [engine.backoff_time(attempt) for _ in range(200)]
+        assert min(times) >= 0.0
+        assert max(times) <= min(3.0,0.5*2**attempt)
+    assert max(engine.backoff_time(3) for _ in range(200)) > 0.5
+
+    #The waits between attempts add up to the time of a failing request
+    fetch = FakeFetch(n_failures=10)
+    engine = FetchEngine(fetch,rate=1000.0,burst=1000.0,max_retries=3,backoff_base=0.05,backoff_max=0.05)
+    engine.backoff_time = lambda attempt: 0.05
+    _,report = engine.fetch_all(["a"])
+    assert report.outcomes[0].elapsed >= 0.15
+
+def test_token_bucket_limits_the_rate():
+
+    #One token at the start, then 20 per second
+    engine = FetchEngine(FakeFetch(),max_concurrency=10,rate=20.0,burst=1.0)
+    t0 = time.monotonic()
+    _,report = engine.fetch_all([f"u{i}" for i in range(11)])
+    assert report.n_ok == 11
+    assert time.monotonic() - t0 >= 0.45
+
+    #The bucket can be used again by the next call, which runs in a new event loop
+    _,report = engine.fetch_all(["a","b"])
+    assert report.n_ok == 2
+
+def test_token_bucket_rejects_invalid_arguments():
+
+    with pytest.raises(ValueError):
+        TokenBucket(0.0,1.0)
+    with pytest.raises(ValueError):
+        TokenBucket(1.0,0.5)
+
+def test_retreive_raw_common_data_from_replay(tmp_path):
+
+    write_api_recordings(str(tmp_path))
+    with ReplayServer(str(tmp_path)) as server:
+        players,teams,matches = gd.retreive_raw_common_data(server.url)
+
+    assert len(players) == 45 and len(teams) == 6
+    assert sum(m.finished for m in matches) > 0
+    assert all(p.history is not None for p in players if p.id % 41 != 0)
+
+def test_retreive_raw_common_data_accepts_wait_time(tmp_path):
+
+    #The old positional wait_time still works, but is deprecated
+    write_api_recordings(str(tmp_path))
+    with ReplayServer(str(tmp_path)) as server:
+        with pytest.warns(DeprecationWarning):
+            players,_,_ = gd.retreive_raw_common_data(server.url,0.01)
+
+    assert sum(p.history is not None for p in players) == 44
+
+def test_player_history_survives_injected_errors(tmp_path):
+
+    write_api_recordings(str(tmp_path))
+    with ReplayServer(str(tmp_path)) as server:
+        players,_ = gd.retreive_players_and_teams(server.url)
+        server.error_rate = 0.3
+        engine = FetchEngine(gd.get_data,rate=1000.0,burst=1000.0,max_retries=8,backoff_base=0.001)
+        report = gd.add_player_history(server.url,players,engine=engine)
+
+    assert report.n_ok == len(players)
+    assert server.n_errors > 0
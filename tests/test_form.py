@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+from fantasydata.classes import Player
+import fantasydata.process_data as pr
+
+def random_histories(n_players:int, seed:int = 0) -> list[np.ndarray]:
+    rng = np.random.default_rng(seed)
+    return [rng.integers(-2,20,size=rng.integers(1,40)).astype(np.float64) for _ in range(n_players)]
+
+def test_ewma_form_matches_prefix_form():
+
+    #The recursive form after every score equals calc_norm_form of the scores up to that score
+    histories = random_histories(50)
+    scores = np.concatenate(histories)
+    positions = np.concatenate([np.arange(len(h)) for h in histories])
+
+    form = pr.ewma_form(scores,positions)
+    expected = np.concatenate([[pr.calc_norm_form(list(h[:i+1])) for i in range(len(h))] for h in histories])
+
+    assert np.allclose(form,expected,rtol=1e-12,atol=1e-12)
+
+def test_ewma_sums_continues_from_initial():
+
+    #Continuing the recursion from a saved sum gives the same form as computing the full history
+    h = random_histories(1,seed=1)[0]
+    k = len(h)//2
+    full = pr.ewma_sums(h,np.arange(len(h)))
+    first = pr.ewma_sums(h[:k],np.arange(k))
+    initial = np.full(len(h)-k, first[-1] if k > 0 else 0.0)
+    rest = pr.ewma_sums(h[k:],np.arange(len(h)-k),initial=initial)
+
+    assert np.allclose(np.r_[first,rest],full,rtol=1e-12,atol=1e-12)
+
+def test_add_players_form_matches_per_player():
+
+    players = []
+    for i,h in enumerate(random_histories(30,seed=2)):
+        p = Player(i+1,f"player {i+1}","mid",1,"team",50)
+        p.history = pd.DataFrame({"fixture":np.arange(len(h))+1,"total_points":h.astype(np.int64)})
+        players.append(p)
+
+    pr.add_players_form(players)
+
+    for p in players:
+        points = p.history["total_points"].values
+        expected = [pr.calc_norm_form(list(points[:i+1])) for i in range(len(points))]
+        assert np.allclose(p.history["form"].values,expected,rtol=1e-12,atol=1e-12)
+        assert np.isclose(p.current_form,expected[-1],rtol=1e-12,atol=1e-12)
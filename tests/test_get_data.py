@@ -0,0 +1,65 @@
+import pytest
+import fantasydata.get_data as gd
+from fantasydata.fetch import FetchEngine, HttpStatusError
+from fantasydata.cache import ResponseCache
+from fantasydata.replay import ReplayServer, recording_path
+from synthetic import write_api_recordings
+
+def test_squad_history_starts_when_the_squad_was_created(tmp_path):
+
+    write_api_recordings(str(tmp_path),first_squad_round=3)
+    with ReplayServer(str(tmp_path)) as server:
+        _,_,current_round = gd.retreive_players_teams_and_round(server.url)
+        n_requests = server.n_requests
+        squad = gd.retreive_squad(server.url,7,current_round=current_round)
+
+        #The current round is not downloaded again
+        assert server.n_requests - n_requests == current_round
+
+    assert current_round == 5
+    assert list(squad.history["round"]) == [3,4,5]
+
+def test_squad_history_fails_on_server_errors(tmp_path):
+
+    write_api_recordings(str(tmp_path))
+    with ReplayServer(str(tmp_path)) as server:
+
+        #Gameweek 1 exists but the server keeps failing, so it must not be taken as a missing gameweek
+        def fetch(url:str) -> dict:
+            if url.endswith("/event/1/picks/"):
+                raise HttpStatusError(f"Error retreiving data from {url}, statuscode: 503", 503)
+            return gd.get_data(url)
+
+        engine = FetchEngine(fetch,max_retries=1,backoff_base=0.001)
+        with pytest.raises(RuntimeError):
+            gd.retreive_squad(server.url,7,engine=engine)
+
+        squad = gd.retreive_squad(server.url,7)
+
+    assert list(squad.history["round"]) == [1,2,3,4,5]
+
+def test_recording_includes_cached_responses(tmp_path):
+
+    recordings = tmp_path / "recordings"
+    write_api_recordings(str(recordings))
+    cache = ResponseCache(str(tmp_path / "cache"),ttl={"fixtures": 0.0})
+
+    with ReplayServer(str(recordings)) as server:
+        urls = [f"{server.url}bootstrap-static/",f"{server.url}fixtures/"]
+        for url in urls:
+            gd.get_data(url,cache)
+
+        #The second requests are a cache hit and a revalidation
+        gd.configure_client(record_dir=str(tmp_path / "record"))
+        try:
+            for url in urls:
+                gd.get_data(url,cache)
+        finally:
+            gd.configure_client()
+
+    assert (cache.hits,cache.revalidated) == (1,1)
+    for url in urls:
+        with open(recording_path(str(tmp_path / "record"),url),"rb") as f:
+            recorded = f.read()
+        with open(recording_path(str(recordings),url),"rb") as f:
+            assert recorded == f.read()
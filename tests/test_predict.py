@@ -0,0 +1,22 @@
+import numpy as np
+import fantasydata.process_data as pr
+import fantasydata.predict as pp
+from synthetic import make_season
+
+def test_headless_fit_is_silent_and_methods_agree(capsys):
+
+    players,teams,matches,squad,initial_elo = make_season(n_players=300)
+    pr.add_calculated_attributes(players,teams,matches,squad,initial_elo)
+    capsys.readouterr()
+
+    fits = {method:pp.fit_player_point_models(players,teams,method=method) for method in pp.FIT_METHODS}
+    assert capsys.readouterr().out == ""
+
+    for full,simple in zip(fits["statsmodels"],fits["numpy"]):
+        assert full.n_observations == simple.n_observations > 0
+        assert np.allclose(list(full.coefficients.values()),list(simple.coefficients.values()),rtol=1e-9,atol=1e-12)
+        assert np.isclose(full.rms,simple.rms) and np.isclose(full.r_squared,simple.r_squared)
+
+    model,simple_model = pp.estimate_linear_model(players,teams,plot=False,verbose=False)
+    assert capsys.readouterr().out == ""
+    assert model.const == fits["statsmodels"][0].model.const
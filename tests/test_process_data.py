@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import fantasydata.process_data as pr
+import fantasydata.predict as pp
+from fantasydata.classes import Season
+from fantasydata.pipeline import IncrementalPipeline
+from synthetic import make_season
+
+def player_columns(players:list) -> list:
+    return [(p.id,p.history["team_id"].values,p.history["round"].values,p.history["form"].values) for p in players if p.history is not None]
+
+@pytest.mark.parametrize("n_workers,chunk_size",[(2,7),(2,500),(1,7)])
+def test_parallel_player_attributes_match_serial(n_workers,chunk_size):
+
+    players,_,matches,_,_ = make_season()
+    pr.add_player_attributes_parallel(players,matches,n_workers=n_workers,chunk_size=chunk_size)
+
+    serial_players,_,serial_matches,_,_ = make_season()
+    pr.add_team_and_round_to_players(serial_players,serial_matches)
+    pr.add_players_form(serial_players)
+
+    for (i,team_ids,rounds,form),(j,serial_team_ids,serial_rounds,serial_form) in zip(player_columns(players),player_columns(serial_players)):
+        assert i == j
+        assert np.array_equal(team_ids,serial_team_ids,equal_nan=True)
+        assert np.array_equal(rounds,serial_rounds,equal_nan=True)
+        assert np.array_equal(form,serial_form,equal_nan=True)
+
+def test_reused_season_uses_changed_histories(tmp_path):
+
+    players,teams,matches,squad,initial_elo = make_season()
+    season = Season(players,teams,matches)
+    pr.add_calculated_attributes(players,teams,matches,squad,initial_elo,season=season)
+
+    #One history is changed in place and one is replaced by a shorter one
+    changed = next(p for p in players if p.history is not None and len(p.history) > 3)
+    changed.history["total_points"] = 20
+    replaced = next(p for p in players if p.history is not None and len(p.history) > 3 and p is not changed)
+    replaced.history = replaced.history.iloc[:2][["fixture","opponent_team","total_points","was_home","minutes","value"]].reset_index(drop=True)
+    season.reindex()
+
+    pr.add_calculated_attributes(players,teams,matches,squad,initial_elo,season=season)
+    assert (changed.history["total_points"] == 20).all()
+    assert np.allclose(changed.history["form"].values,20.0)
+    assert len(replaced.history) == 2
+
+    X,Y = pp.linear_model_features(players,teams,season)
+    assert (Y == 20).sum() >= (changed.history["minutes"].values[3:] != 0).sum() > 0
+
+    #The same with the incremental pipeline
+    changed.history["total_points"] = 30
+    IncrementalPipeline(f"{tmp_path}/").run(players,teams,matches,squad,initial_elo,season)
+    assert (changed.history["total_points"] == 30).all()
+    assert np.allclose(changed.history["form"].values,30.0)
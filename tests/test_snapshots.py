@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+import fantasydata.process_data as pr
+import fantasydata.utility as ut
+from fantasydata.snapshots import SnapshotStore, canonical_column
+from fantasydata.storage import CsvBackend, SqliteBackend
+from synthetic import make_season
+
+def processed_season(n_finished_rounds:int = 8) -> tuple:
+    players,teams,matches,squad,initial_elo = make_season(n_finished_rounds=n_finished_rounds)
+    pr.add_calculated_attributes(players,teams,matches,squad,initial_elo)
+    return players,teams,matches,squad
+
+def test_datetimes_have_the_same_text_after_a_round_trip():
+
+    _,_,matches,_ = processed_season()
+    start_time = ut.list_to_dataframe(matches)["start_time"]
+    assert list(canonical_column(start_time)) == list(canonical_column(start_time.astype(str)))
+    assert list(canonical_column(start_time)) == list(canonical_column(start_time.dt.tz_convert("Europe/London").astype(str)))
+
+@pytest.mark.parametrize("backend",[CsvBackend(),SqliteBackend()])
+def test_unchanged_write_has_no_changed_rows(tmp_path, backend):
+
+    players,teams,matches,squad = processed_season()
+    store = SnapshotStore(str(tmp_path),backend)
+    store.write(1,players,teams,matches,squad)
+    store.write(2,players,teams,matches,squad)
+
+    #A store opened again replays the deltas once and gets the same result, later writes read nothing
+    store = SnapshotStore(str(tmp_path),backend)
+    store.write(3,players,teams,matches,squad)
+    read = backend.read
+    n_reads = []
+    backend.read = lambda *args: n_reads.append(args) or read(*args)
+    store.write(4,players,teams,matches,squad)
+    del backend.read
+    assert n_reads == []
+
+    for entry in store.manifest[1:]:
+        for table,parts in entry["tables"].items():
+            for part,counts in parts.items():
+                assert (counts["changed"],counts["deleted"]) == (0,0), (entry["gameweek"],table,part)
+
+def test_changed_rows_are_written_and_read_back(tmp_path):
+
+    players,teams,matches,squad = processed_season(7)
+    store = SnapshotStore(str(tmp_path))
+    store.write(7,players,teams,matches,squad)
+
+    players,teams,matches,squad = processed_season(8)
+    store.write(8,players,teams,matches,squad)
+    counts = store.manifest[-1]["tables"]
+
+    #The eighth round adds rows for every player that played, finishes the matches of that round and changes
+    #the predictions of the next round
+    assert 0 < counts["players"]["history"]["changed"] < sum(len(p.history) for p in players if p.history is not None)
+    assert len([m for m in matches if m.round == 8]) <= counts["matches"]["entities"]["changed"] < len(matches)
+
+    read_players,_,read_matches,_ = store.read(8)
+    for p,q in zip(sorted(players,key=lambda p: p.id),sorted(read_players,key=lambda p: p.id)):
+        if p.history is not None:
+            assert np.array_equal(p.history["total_points"].values,q.history["total_points"].values)
+    assert [m.finished for m in sorted(read_matches,key=lambda m: m.id)] == [m.finished for m in sorted(matches,key=lambda m: m.id)]
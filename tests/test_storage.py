@@ -0,0 +1,68 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+import fantasydata.process_data as pr
+import fantasydata.utility as ut
+from fantasydata.storage import StorageBackend, CsvBackend, ParquetBackend, SqliteBackend
+from synthetic import make_season
+
+def backend(name:str) -> StorageBackend:
+    if name == "parquet":
+        pytest.importorskip("pyarrow")
+        return ParquetBackend()
+    if name == "sqlite":
+        return SqliteBackend()
+    return CsvBackend()
+
+@pytest.mark.parametrize("name",["csv","parquet","sqlite"])
+def test_round_trip(tmp_path, name):
+
+    players,teams,matches,squad,initial_elo = make_season()
+    pr.add_calculated_attributes(players,teams,matches,squad,initial_elo)
+    for p in players:
+        p.predicted_points = [1.5,2.0]
+
+    b = backend(name)
+    directory = f"{tmp_path}/"
+    ut.save_all_data(directory,players,teams,matches,squad,"test",b)
+    assert b.exists(directory,"players_test") and not b.exists(directory,"players_other")
+
+    read_players,read_teams,read_matches = ut.read_main_data(directory,"test",b)
+    read_squad = ut.read_squad_data(directory,squad.id,"test",b)
+
+    for p,q in zip(players,read_players):
+        assert (p.id,p.name,p.position,p.current_value,p.squad_adjusted_value) == (q.id,q.name,q.position,q.current_value,q.squad_adjusted_value)
+        if ut.has_history(p):
+            for c in ["fixture","total_points","minutes","team_id","round","value"]:
+                assert np.array_equal(q.history[c].values,p.history[c].values)
+            assert np.allclose(q.history["form"].values,p.history["form"].values)
+    for t,u in zip(teams,read_teams):
+        assert list(u.current_player_ids) == list(t.current_player_ids)
+        assert np.allclose(u.history["elo_after_match"].values,t.history["elo_after_match"].values)
+    for m,n in zip(matches,read_matches):
+        assert (m.id,m.round,m.finished,pd.Timestamp(m.start_time)) == (n.id,n.round,n.finished,pd.Timestamp(n.start_time))
+    assert [list(ids) for ids in read_squad.history["player_ids"]] == [list(ids) for ids in squad.history["player_ids"]]
+
+    #Only the requested columns are read. The predictions are stored in the last row of every player
+    table = ut.read_player_table(directory,["player_id","predicted_points"],"test",b)
+    assert list(table.keys()) == ["player_id","predicted_points"]
+    predicted = [json.loads(v) if isinstance(v,str) else list(v) for v in table["predicted_points"].values if v is not None and not (isinstance(v,float) and np.isnan(v))]
+    assert predicted == [[1.5,2.0]]*len(players)
+
+def test_parquet_schema_is_fixed_for_known_columns(tmp_path):
+
+    pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    #A column of an int type with missing values, or only missing values, keeps its type
+    df = pd.DataFrame({"player_id": [1,2], "fixture": [3.0,np.nan], "team_id": [None,None], "name": [None,"b"], "player_ids": [None,[1,2]]})
+    ParquetBackend().write(df,f"{tmp_path}/","t")
+    schema = pq.read_schema(f"{tmp_path}/t.parquet")
+    assert [str(schema.field(c).type) for c in df.keys()[:4]] == ["int64","int64","int64","string"]
+    assert str(schema.field("player_ids").type.value_type) == "int64"
+
+def test_storage_backend_is_abstract():
+
+    with pytest.raises(TypeError):
+        StorageBackend()
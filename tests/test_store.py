@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import fantasydata.utility as ut
+from fantasydata.store import HistoryStore
+from synthetic import make_season
+
+def attached_store() -> tuple:
+    players,_,_,_,_ = make_season()
+    with_history = [p for p in players if ut.has_history(p)]
+    expected = {p.id:p.history.copy() for p in with_history}
+    store = HistoryStore.from_entities(with_history,"player_id")
+    store.attach(with_history)
+    return players,store,expected
+
+def test_histories_are_sliced_from_the_store():
+
+    players,store,expected = attached_store()
+    for p in players:
+        if p.id in expected:
+            pd.testing.assert_frame_equal(p.history,expected[p.id],check_dtype=False)
+        else:
+            assert p.history is None
+
+def test_new_columns_are_seen_without_rebuilding_histories():
+
+    players,store,_ = attached_store()
+    p = next(p for p in players if p.id in store)
+    before = p.history
+
+    #A change of the table does not touch the entities, the history is sliced again when it is used
+    store.set_column("x",np.arange(len(store)))
+    start,stop = store.starts[store.ids == p.id][0],store.stops[store.ids == p.id][0]
+    assert np.array_equal(p.history["x"].values,np.arange(start,stop))
+    assert "x" not in before.keys()
+    assert p.history is p.history
+
+def test_setting_a_history_detaches_the_entity():
+
+    players,store,_ = attached_store()
+    p = next(p for p in players if p.id in store)
+    p.history = pd.DataFrame({"total_points": [1,2]})
+    store.set_column("x",np.zeros(len(store)))
+    assert list(p.history.keys()) == ["total_points"]
+
+def test_current_form_follows_the_store():
+
+    players,store,_ = attached_store()
+    p = next(p for p in players if p.id in store)
+    store.set_column("form",np.full(len(store),2.0))
+    assert p.current_form == 2.0
+    store.set_column("form",np.full(len(store),3.0))
+    assert p.current_form == 3.0
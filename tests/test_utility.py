@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import fantasydata.process_data as pr
+import fantasydata.utility as ut
+from synthetic import make_season
+
+def processed_season() -> tuple:
+    players,teams,matches,squad,initial_elo = make_season()
+    pr.add_calculated_attributes(players,teams,matches,squad,initial_elo)
+    return players,teams,matches,squad
+
+def test_list_to_dataframe_matches_per_object_frames():
+
+    #The one pass frame has the same rows as concatenating the frame of every object
+    players,teams,matches,_ = processed_season()
+    for objects in [players,teams,matches]:
+        expected = pd.concat([o.to_dataframe() for o in objects],ignore_index=True)
+        df = ut.list_to_dataframe(objects)
+        pd.testing.assert_frame_equal(df[expected.keys()],expected,check_dtype=False)
+
+def test_save_and_read_round_trip(tmp_path):
+
+    players,teams,matches,squad = processed_season()
+    directory = f"{tmp_path}/"
+    ut.save_all_data(directory,players,teams,matches,squad,"test")
+    read_players,read_teams,read_matches = ut.read_main_data_from_csv(directory,"test")
+
+    assert [p.id for p in read_players] == [p.id for p in players]
+    for p,q in zip(players,read_players):
+        assert (p.name,p.position,p.current_team_id,p.current_value,p.squad_adjusted_value) == (q.name,q.position,q.current_team_id,q.current_value,q.squad_adjusted_value)
+        if ut.has_history(p):
+            for c in ["fixture","total_points","minutes","team_id","round"]:
+                assert np.array_equal(q.history[c].values,p.history[c].values)
+            assert np.allclose(q.history["form"].values,p.history["form"].values)
+
+    for t,u in zip(teams,read_teams):
+        assert t.id == u.id and list(u.current_player_ids) == list(t.current_player_ids)
+        assert np.array_equal(u.history["match_id"].values,t.history["match_id"].values)
+        assert np.allclose(u.history["elo_after_match"].values,t.history["elo_after_match"].values)
+
+    assert [m.id for m in read_matches] == [m.id for m in matches]
+    assert ut.read_squad_data_from_csv(directory,squad.id,"test").current_players == squad.current_players